@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.replicas import replicate
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную базу SQLite в реплики. С --interval копирует "
+        "раз в N секунд: реплики отстают, как при настоящей репликации."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database", action="append", dest="replicas",
+            help="Реплика из DATABASE_REPLICAS, по умолчанию все.",
+        )
+        parser.add_argument("--interval", type=float)
+
+    def handle(self, *args, **options):
+        replicas = options["replicas"] or settings.DATABASE_REPLICAS
+        unknown = set(replicas) - set(settings.DATABASE_REPLICAS)
+        if unknown:
+            raise CommandError(f"Нет таких реплик: {', '.join(unknown)}")
+        if not replicas:
+            raise CommandError("Реплики не настроены: DJANGO_DB_REPLICAS.")
+        if connections[DEFAULT_DB_ALIAS].vendor != "sqlite":
+            raise CommandError("Команда работает только с SQLite.")
+        while True:
+            for alias in replicas:
+                started = time.monotonic()
+                replicate(alias)
+                self.stdout.write(
+                    f"{alias}: {time.monotonic() - started:.2f} с"
+                )
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+MEGABYTE = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Обслуживает базу SQLite: PRAGMA optimize, а по флагам — полный "
+        "ANALYZE и VACUUM со сбросом журнала WAL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            "--analyze", action="store_true",
+            help="Пересобрать статистику планировщика по всем индексам.",
+        )
+        parser.add_argument(
+            "--vacuum", action="store_true",
+            help="Переписать файл без пустых страниц. Блокирует запись.",
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if connection.vendor != "sqlite":
+            raise CommandError("Команда работает только с SQLite.")
+        with connection.cursor() as cursor:
+            self.cursor = cursor
+            size = self.size()
+            if options["analyze"]:
+                self.run("ANALYZE")
+            self.run("PRAGMA optimize")
+            if options["vacuum"]:
+                self.run("VACUUM")
+                self.run("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.stdout.write(
+                f"Размер базы: {size / MEGABYTE:.1f} МБ → "
+                f"{self.size() / MEGABYTE:.1f} МБ, "
+                f"свободных страниц: {self.pragma('freelist_count')}"
+            )
+
+    def run(self, sql):
+        started = time.monotonic()
+        self.cursor.execute(sql)
+        self.stdout.write(f"{sql}: {time.monotonic() - started:.2f} с")
+
+    def pragma(self, name):
+        self.cursor.execute(f"PRAGMA {name}")
+        return self.cursor.fetchone()[0]
+
+    def size(self):
+        return self.pragma("page_count") * self.pragma("page_size")
@@ -0,0 +1,163 @@
+"""Чтение страниц с реплик базы.
+
+Реплики перечислены в ``settings.DATABASE_REPLICAS``. Представления,
+обёрнутые в ``replica_reads``, на запросы GET и HEAD читают с одной
+случайной реплики; всё остальное, включая записи и сессии, идёт в
+основную базу.
+
+Реплика отстаёт от основной базы, поэтому после записи в базу
+``ReplicaMiddleware`` закрепляет сессию за основной базой на
+``REPLICA_PIN_SECONDS``: автор сразу видит свой пост, комментарий или
+подписку, а остальные — после следующей репликации. Закрепляются только
+уже существующие сессии: ради анонимного запроса сессия не создаётся.
+
+Для SQLite репликация — это копирование основной базы в файлы реплик
+(``replicate``, команда ``replicate``). Каждая копия получает свой номер
+(``generation``), он хранится в самой реплике. Кэши по данным реплики
+хранятся отдельно от кэшей по основной базе и по другим копиям (см.
+``posts.caching.get_versions``): закреплённая сессия не получает из кэша
+устаревших страниц, а после копирования страницы собираются заново,
+в каком бы процессе ни запускалась ``replicate``.
+"""
+import random
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_KEY = "db_primary_until"
+# Сессии читаются до представления и должны быть свежими всегда.
+PRIMARY_APPS = {"sessions"}
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+SESSION_TABLE = "django_session"
+# Номер копии хранится в заголовке базы, в ``PRAGMA user_version``.
+GENERATION_LIMIT = 2 ** 31
+
+_state = threading.local()
+
+
+def replicas():
+    return list(settings.DATABASE_REPLICAS)
+
+
+def reading_replica():
+    """Реплика, с которой читает текущий запрос, или ``None``."""
+    return getattr(_state, "replica", None)
+
+
+def generation():
+    """Номер копии базы на реплике текущего запроса или ``None``."""
+    return getattr(_state, "generation", None)
+
+
+def _user_version(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute("PRAGMA user_version")
+        return cursor.fetchone()[0]
+
+
+def is_pinned(request):
+    """Сессия недавно писала в базу и читает только из основной."""
+    return request.session.get(PIN_KEY, 0) > time.time()
+
+
+def replica_reads(view):
+    """Отдаёт чтения представления реплике, если сессия не закреплена.
+
+    Реплика выбирается одна на запрос: версии кэша, число постов и сами
+    посты страницы читаются из одной копии базы.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ("GET", "HEAD") or not replicas()
+                or is_pinned(request)):
+            return view(request, *args, **kwargs)
+        _state.replica = random.choice(replicas())
+        try:
+            # Номер читается до данных: страница может оказаться новее
+            # своей копии, но не старее.
+            _state.generation = _user_version(_state.replica)
+            return view(request, *args, **kwargs)
+        finally:
+            _state.replica = _state.generation = None
+    return wrapper
+
+
+class ReplicaMiddleware:
+    """Закрепляет сессию за основной базой после записи в запросе."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replicas():
+            return self.get_response(request)
+        _state.wrote = False
+        with ExitStack() as stack:
+            for alias in connections:
+                if alias not in replicas():
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(_note_write)
+                    )
+            response = self.get_response(request)
+        if _state.wrote and request.session.session_key is not None:
+            request.session[PIN_KEY] = (
+                time.time() + settings.REPLICA_PIN_SECONDS
+            )
+        return response
+
+
+def _note_write(execute, sql, params, many, context):
+    statement = sql.lstrip()[:7].upper()
+    if statement.startswith(WRITE_STATEMENTS) and SESSION_TABLE not in sql:
+        _state.wrote = True
+    return execute(sql, params, many, context)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in PRIMARY_APPS:
+            return reading_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Объект, прочитанный с реплики, сохраняется в основную базу.
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db in replicas():
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема попадает на реплику вместе с данными.
+        if db in replicas():
+            return False
+        return None
+
+
+def replicate(alias, source=DEFAULT_DB_ALIAS):
+    """Копирует базу SQLite ``source`` в реплику ``alias``.
+
+    Используется API резервного копирования SQLite: читатели реплики
+    видят либо старую копию, либо новую целиком. Перед копированием
+    основная база получает следующий номер копии, и он попадает в
+    реплику вместе с данными.
+    """
+    number = (_user_version(source) + 1) % GENERATION_LIMIT
+    primary = connections[source]
+    with primary.cursor() as cursor:
+        cursor.execute(f"PRAGMA user_version = {number:d}")
+    target = sqlite3.connect(connections[alias].settings_dict["NAME"])
+    try:
+        primary.connection.backup(target)
+    finally:
+        target.close()
@@ -0,0 +1,19 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# Настройки, с которыми идут все тесты: миниатюры делаются в потоке
+# запроса, а не в фоне, пока тест уже удаляет временный MEDIA_ROOT.
+TEST_SETTINGS = {"THUMBNAIL_WORKERS": 0}
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с ``TEST_SETTINGS``."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(**TEST_SETTINGS)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,164 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import closing
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.replicas import PIN_KEY, replicate
+from posts import counters
+from posts.models import Comment, Follow, Post
+
+User = get_user_model()
+
+REPLICA = "replica"
+SECOND_REPLICA = "replica-2"
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRoutingTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        # Реплика — отдельный файл, основная база теста — в памяти.
+        for alias in (REPLICA, SECOND_REPLICA):
+            connections.databases[alias] = {
+                "ENGINE": "core.backends.sqlite3",
+                "NAME": os.path.join(cls.directory, f"{alias}.sqlite3"),
+            }
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in (REPLICA, SECOND_REPLICA):
+            connections[alias].close()
+            del connections.databases[alias]
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.reader = User.objects.create_user(username="reader")
+        self.post = Post.objects.create(text="старый пост", author=self.author)
+        replicate(REPLICA)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def profile(self, client):
+        return client.get(reverse("posts:profile", args=["author"]))
+
+    def test_pages_read_from_replica_until_it_is_copied(self):
+        Post.objects.create(text="новый пост", author=self.author)
+        with CaptureQueriesContext(connections[REPLICA]) as queries:
+            response = self.client.get(reverse("posts:index"))
+        self.assertTrue(queries)
+        self.assertContains(response, "старый пост")
+        self.assertNotContains(response, "новый пост")
+        replicate(REPLICA)
+        # Страница из кэша, собранная по старой копии, тоже сброшена.
+        self.assertContains(
+            self.client.get(reverse("posts:index")), "новый пост"
+        )
+
+    def test_copy_number_is_stored_in_replica(self):
+        # Номер копии читается из файла реплики, поэтому его видят все
+        # процессы, а не только тот, что запускал replicate.
+        def copy_number():
+            name = connections.databases[REPLICA]["NAME"]
+            with closing(sqlite3.connect(name)) as replica:
+                return replica.execute("PRAGMA user_version").fetchone()[0]
+
+        number = copy_number()
+        replicate(REPLICA)
+        self.assertNotEqual(copy_number(), number)
+
+    def test_writer_reads_own_writes(self):
+        self.author_client.post(
+            reverse("posts:post_create"), {"text": "мой пост"}
+        )
+        self.author_client.post(
+            reverse("posts:add_comment", args=[self.post.pk]),
+            {"text": "мой комментарий"},
+        )
+        self.assertTrue(Comment.objects.using("default").exists())
+        self.assertFalse(Comment.objects.using(REPLICA).exists())
+        # Страница по отстающей реплике не попадает к автору из кэша.
+        self.assertNotContains(self.profile(self.reader_client), "мой пост")
+        self.assertContains(self.profile(self.author_client), "мой пост")
+        self.assertContains(
+            self.author_client.get(
+                reverse("posts:post_detail", args=[self.post.pk])
+            ),
+            "мой комментарий",
+        )
+
+    def test_follow_is_visible_to_follower(self):
+        self.reader_client.get(
+            reverse("posts:profile_follow", args=["author"])
+        )
+        self.assertFalse(Follow.objects.using(REPLICA).exists())
+        self.assertContains(
+            self.reader_client.get(reverse("posts:follow_index")),
+            "старый пост",
+        )
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_pin_expires(self):
+        self.author_client.post(
+            reverse("posts:post_create"), {"text": "мой пост"}
+        )
+        self.assertIn(PIN_KEY, self.author_client.session)
+        self.assertNotContains(self.profile(self.author_client), "мой пост")
+
+    def test_reads_do_not_pin_session(self):
+        self.reader_client.get(reverse("posts:index"))
+        self.assertNotIn(PIN_KEY, self.reader_client.session)
+
+    def test_pages_without_writes_do_not_pin_session(self):
+        # Строки счётчиков нет на реплике, поэтому профиль ищет её в
+        # основной базе, но там она уже есть и ничего не пишется.
+        counters.stats_for(self.author.pk)
+        self.profile(self.reader_client)
+        self.assertNotIn(PIN_KEY, self.reader_client.session)
+
+    def test_anonymous_request_gets_no_session(self):
+        response = self.profile(self.client)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_replicate_command(self):
+        Post.objects.create(text="новый пост", author=self.author)
+        out = StringIO()
+        call_command("replicate", stdout=out)
+        self.assertIn(REPLICA, out.getvalue())
+        self.assertEqual(Post.objects.using(REPLICA).count(), 2)
+
+    def test_request_reads_one_replica(self):
+        replicate(SECOND_REPLICA)
+        with self.settings(DATABASE_REPLICAS=[REPLICA, SECOND_REPLICA]):
+            for _ in range(5):
+                cache.clear()
+                contexts = [CaptureQueriesContext(connections[alias])
+                            for alias in (REPLICA, SECOND_REPLICA)]
+                for context in contexts:
+                    context.__enter__()
+                try:
+                    self.client.get(reverse("posts:index"), {"page": 1})
+                finally:
+                    for context in contexts:
+                        context.__exit__(None, None, None)
+                self.assertEqual(
+                    sorted(bool(len(context)) for context in contexts),
+                    [False, True],
+                )
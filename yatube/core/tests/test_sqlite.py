@@ -0,0 +1,40 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.backends.sqlite3.base import PRAGMAS
+
+
+@skipUnless(
+    connection.vendor == "sqlite"
+    and connection.settings_dict["ENGINE"] == "core.backends.sqlite3",
+    "Нужен настроенный бэкенд SQLite",
+)
+class TunedSQLiteTests(TransactionTestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied(self):
+        self.assertEqual(self.pragma("synchronous"), 1)
+        self.assertEqual(
+            self.pragma("busy_timeout"), PRAGMAS["busy_timeout"]
+        )
+        self.assertEqual(self.pragma("cache_size"), PRAGMAS["cache_size"])
+
+    def test_transactions_take_write_lock_at_start(self):
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                pass
+        self.assertEqual(queries[0]["sql"], "BEGIN IMMEDIATE")
+
+    def test_maintenance_command(self):
+        out = StringIO()
+        call_command("sqlite_maintenance", "--analyze", stdout=out)
+        self.assertIn("ANALYZE", out.getvalue())
+        self.assertIn("PRAGMA optimize", out.getvalue())
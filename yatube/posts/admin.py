@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Group, Post, Comment
+from .search import filter_matching, match_expression, uses_fts
 
 
 @admin.register(Post)
@@ -17,6 +18,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        if not uses_fts() or not match_expression(search_term):
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return filter_matching(queryset, search_term), False
+
 
 admin.site.register(Group)
 
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PostsConfig(AppConfig):
     name = "posts"
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .search import install_triggers
+
+        post_migrate.connect(install_triggers, sender=self)
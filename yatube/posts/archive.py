@@ -0,0 +1,169 @@
+"""Архив старых постов.
+
+Ленты почти всегда показывают свежие посты, а ``posts_post`` хранит всю
+историю: индексы ленты и кэш страниц SQLite растут вместе с ней. Команда
+``archive_posts`` переносит посты старше ``POST_ARCHIVE_AFTER_DAYS`` дней
+вместе с комментариями в таблицы ``ArchivedPost`` и ``ArchivedComment``
+той же базы (при шардировании — того же шарда).
+
+Общая лента, группы и лента подписок читают только горячую таблицу.
+Профиль сливает горячие посты автора с архивными (``author_posts``),
+поиск — выдачи индексов обеих таблиц (``posts.search``), а страница
+поста ищет его в архиве, если в горячей таблице его нет
+(``get_post_or_404``). Номер, даты, картинка и счётчики
+поста при переносе не меняются, поэтому ссылки и счётчики автора
+остаются верными.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+)
+from django.http import Http404
+from django.utils import timezone
+
+from . import caching, feeds, sharding
+from .models import ArchivedComment, ArchivedPost, Comment, FeedItem, Post
+from .sharding import MergedQuerySet
+
+POST_FIELDS = [field.attname for field in ArchivedPost._meta.concrete_fields]
+COMMENT_FIELDS = [
+    field.attname for field in ArchivedComment._meta.concrete_fields
+]
+
+SIZE_SQL = """
+    SELECT SUM(pgsize) FROM dbstat WHERE name = %s OR name IN (
+        SELECT name FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = %s
+    )
+"""
+
+
+def cutoff(days=None):
+    """Посты, опубликованные раньше этого момента, уходят в архив."""
+    if days is None:
+        days = settings.POST_ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def stale(before, using=DEFAULT_DB_ALIAS):
+    """Горячие посты базы ``using``, опубликованные раньше ``before``."""
+    return Post.objects.using(using).filter(pub_date__lt=before)
+
+
+def archive(before, batch_size=500, using=DEFAULT_DB_ALIAS):
+    """Переносит посты старше ``before`` в архив пачками.
+
+    Возвращает ``(постов, комментариев)``. Старейшие посты берутся по
+    индексу ``pub_date``, каждая пачка переносится своей транзакцией.
+    """
+    posts = stale(before, using).order_by("pub_date", "pk")
+    moved_posts = moved_comments = 0
+    while True:
+        rows = list(posts.values_list("pk", "author_id", "group_id")
+                    [:batch_size])
+        if not rows:
+            return moved_posts, moved_comments
+        moved_comments += move([post_id for post_id, _, _ in rows], using)
+        moved_posts += len(rows)
+        forget(rows)
+
+
+def move(post_ids, using=DEFAULT_DB_ALIAS):
+    """Копирует посты с комментариями в архив и удаляет их.
+
+    Как и в ``rebalance_shards``, строки удаляются без сигналов: для
+    счётчиков и картинок пост никуда не делся. Из лент подписок пост
+    убирается, а из поискового индекса горячих постов в индекс архива
+    его переносят триггеры.
+    """
+    with transaction.atomic(using=using):
+        ArchivedPost.objects.using(using).bulk_create(
+            [ArchivedPost(**row) for row in Post.objects.using(using)
+             .filter(pk__in=post_ids).values(*POST_FIELDS)],
+            ignore_conflicts=True,
+        )
+        comments = [
+            ArchivedComment(**row) for row in Comment.objects.using(using)
+            .filter(post_id__in=post_ids).values(*COMMENT_FIELDS)
+        ]
+        ArchivedComment.objects.using(using).bulk_create(
+            comments, ignore_conflicts=True
+        )
+        FeedItem.objects.filter(post_id__in=post_ids).delete()
+        placeholders = ", ".join(["%s"] * len(post_ids))
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {Comment._meta.db_table} "
+                f"WHERE post_id IN ({placeholders})",
+                post_ids,
+            )
+            cursor.execute(
+                f"DELETE FROM {Post._meta.db_table} "
+                f"WHERE id IN ({placeholders})",
+                post_ids,
+            )
+    return len(comments)
+
+
+def forget(rows):
+    """Сбрасывает кэши лент, из которых ушли посты ``rows``."""
+    scopes = {caching.posts_scope()}
+    for post_id, author_id, group_id in rows:
+        scopes.add(caching.post_scope(post_id))
+        scopes.add(caching.author_scope(author_id))
+        if group_id:
+            scopes.add(caching.group_scope(group_id))
+        if feeds.uses("pull"):
+            feeds.forget_recent(author_id)
+    caching.bump(*scopes)
+
+
+def table_size(table, using=DEFAULT_DB_ALIAS):
+    """``(строк, байт)`` таблицы вместе с её индексами.
+
+    Байты считает виртуальная таблица SQLite ``dbstat``; если её нет,
+    вместо них ``None``.
+    """
+    conn = connections[using]
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {conn.ops.quote_name(table)}")
+        rows = cursor.fetchone()[0]
+        if conn.vendor != "sqlite":
+            return rows, None
+        try:
+            cursor.execute(SIZE_SQL, [table, table])
+        except DatabaseError:
+            return rows, None
+        return rows, cursor.fetchone()[0] or 0
+
+
+def get_post_or_404(post_id, *fields):
+    """Пост из горячей таблицы, а если его там нет — из архива.
+
+    Без ``fields`` пост выбирается с автором и группой для карточки,
+    иначе — только с этими полями.
+    """
+    for model in (Post, ArchivedPost):
+        posts = (model.objects.only(*fields) if fields
+                 else model.objects.for_feed())
+        try:
+            return sharding.get_post_or_404(posts, post_id)
+        except Http404:
+            pass
+    raise Http404("Пост не найден")
+
+
+def author_posts(author_id):
+    """Посты автора для профиля: горячие, а за ними архивные.
+
+    Обе таблицы лежат в одной базе, поэтому страницу по номеру
+    отсчитывает сама база, а не слияние первых строк таблиц.
+    """
+    return MergedQuerySet([
+        sharding.for_author(
+            model.objects.filter(author_id=author_id).for_feed(), author_id
+        )
+        for model in (Post, ArchivedPost)
+    ])
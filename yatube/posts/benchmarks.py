@@ -0,0 +1,82 @@
+"""Общие помощники для management-команд ``bench_*``.
+
+Данные для замеров создаются внутри транзакции, которая всегда
+откатывается, поэтому бенчмарк можно запускать на рабочей базе.
+"""
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from .models import Group, Post
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+BENCH_PREFIX = "bench"
+
+
+@contextmanager
+def throwaway_data():
+    """Выполняет блок в транзакции и откатывает её в конце."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def seed_users(count, prefix=BENCH_PREFIX):
+    User.objects.bulk_create(
+        [User(username=f"{prefix}-{index}") for index in range(count)],
+        batch_size=BATCH_SIZE,
+    )
+    return list(User.objects.filter(username__startswith=f"{prefix}-"))
+
+
+def seed_posts(count, authors, groups=(), text="Пост для замера"):
+    """Создаёт ``count`` постов с различающимися датами публикации.
+
+    Посты распределяются по авторам и группам по кругу; самые новые
+    посты получают самые большие ``id``, как и в живой базе. ``text``
+    может быть функцией от номера поста.
+    """
+    first_id = (Post.objects.order_by("-pk").values_list(
+        "pk", flat=True).first() or 0) + 1
+    batch = []
+    for index in range(count):
+        batch.append(Post(
+            text=text(index) if callable(text) else f"{text} {index}",
+            author=authors[index % len(authors)],
+            group=groups[index % len(groups)] if groups else None,
+        ))
+        if len(batch) == BATCH_SIZE:
+            Post.objects.bulk_create(batch)
+            batch = []
+    Post.objects.bulk_create(batch)
+    # auto_now_add выставляет всем одну и ту же дату, разводим их.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE posts_post SET pub_date = "
+            "datetime('2020-01-01', '+' || id || ' seconds') "
+            "WHERE id >= %s",
+            [first_id],
+        )
+
+
+def seed_groups(count, prefix=BENCH_PREFIX):
+    Group.objects.bulk_create([
+        Group(title=f"{prefix} {index}", slug=f"{prefix}-{index}",
+              description="")
+        for index in range(count)
+    ])
+    return list(Group.objects.filter(slug__startswith=f"{prefix}-"))
+
+
+def best_time(func, repeat=5):
+    """Лучшее время выполнения ``func`` из ``repeat`` попыток, в мс."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
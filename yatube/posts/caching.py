@@ -0,0 +1,165 @@
+"""Кэш лент, который сбрасывается при изменении постов.
+
+Каждой области (вся лента, группа, автор, лента подписок пользователя)
+соответствует номер версии в кэше. Версии входят в ключ фрагмента
+``{% cache %}``, поэтому сигнал о сохранении или удалении поста
+инвалидирует только затронутые ленты, а ключи старых версий просто
+вытесняются со временем. Кэш общий для всех процессов (см.
+``posts.checks``); новая версия не прибавляется к старой, а пишется
+заново, поэтому одновременные сбросы не теряются.
+
+Если страницы читаются с реплик базы (см. ``core.replicas``), фрагмент
+новой версии мог собраться из ещё не обновлённой реплики. Поэтому ключи
+по данным реплики отличаются от ключей по основной базе суффиксом с
+номером копии: после следующего копирования они больше не читаются.
+"""
+import hashlib
+import secrets
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from core.replicas import generation
+
+VERSION_KEY = "feed:version:{}"
+COUNT_KEY = "feed:count:{}"
+
+
+def posts_scope():
+    return "posts"
+
+
+def group_scope(group_id):
+    return f"group:{group_id}"
+
+
+def author_scope(author_id):
+    return f"author:{author_id}"
+
+
+def follow_scope(user_id):
+    return f"follow:{user_id}"
+
+
+def post_scope(post_id):
+    return f"post:{post_id}"
+
+
+def stats_scope(user_id):
+    return f"stats:{user_id}"
+
+
+def _new_version():
+    # Случайная, а не следующая по счёту: если ключ версии вытеснен или
+    # кэш пережил базу, старые фрагменты не станут снова актуальными.
+    return secrets.token_hex(8)
+
+
+def get_versions(*scopes):
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {
+        key: _new_version() for key in keys if key not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    versions = ".".join(str(versions[key]) for key in keys)
+    number = generation()
+    if number is not None:
+        # Страницы по отстающей реплике не должны достаться сессии,
+        # которая читает из основной базы, и читателям следующей копии.
+        versions += f".replica{number}"
+    return versions
+
+
+def bump(*scopes):
+    """Инвалидирует закэшированные ленты областей ``scopes``."""
+    now_and_on_commit(_bump, scopes)
+
+
+def _bump(scopes):
+    cache.set_many(
+        {VERSION_KEY.format(scope): _new_version() for scope in scopes},
+        None,
+    )
+
+
+def now_and_on_commit(func, *args):
+    """Вызывает ``func`` сразу и ещё раз после фиксации транзакций.
+
+    Пока транзакция записи не зафиксирована, другой процесс читает
+    прежние данные и может закэшировать их под уже новой версией;
+    второй вызов сбрасывает и такие записи.
+    """
+    func(*args)
+    for alias in connections:
+        connection = connections[alias]
+        if connection.in_atomic_block:
+            connection.on_commit(partial(func, *args))
+
+
+def bump_post(post_id, author_id, *group_ids):
+    """Инвалидирует ленты и страницы, на которых виден пост."""
+    bump(
+        posts_scope(),
+        author_scope(author_id),
+        post_scope(post_id),
+        *(group_scope(group_id) for group_id in group_ids if group_id),
+    )
+
+
+def feed_cache(request, *scopes):
+    """Параметры ``{% cache %}`` для страницы ленты.
+
+    Ключ зависит от версий областей и от курсора или номера страницы,
+    поэтому каждая страница кэшируется отдельно.
+    """
+    return {
+        "timeout": settings.FEED_CACHE_TIMEOUT,
+        "key": f"{get_versions(*scopes)}:{request.GET.urlencode()}",
+    }
+
+
+def etag(request, *scopes):
+    """ETag страницы, которая зависит только от областей ``scopes``.
+
+    Страницы авторизованного пользователя отличаются шапкой и кнопками,
+    поэтому в их ETag входит ещё и ``pk`` пользователя. А их формы несут
+    токен CSRF, который ``login()`` меняет: в ETag входят и cookie CSRF,
+    и ключ сессии, иначе после повторного входа браузер получил бы 304
+    и отправил бы форму со старым токеном.
+    """
+    parts = [get_versions(*scopes)]
+    if request.user.is_authenticated:
+        parts.append(f"user:{request.user.pk}")
+        parts.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""))
+        parts.append(request.session.session_key or "")
+    return hashlib.md5(":".join(parts).encode()).hexdigest()
+
+
+def cached_count(queryset, *scopes):
+    """``COUNT(*)`` ленты, закэшированный до изменения её постов.
+
+    Возвращает ``(count, is_estimate)``. Если записей больше
+    ``FEED_COUNT_ESTIMATE_THRESHOLD``, число запоминается ещё и без
+    версии на ``FEED_COUNT_ESTIMATE_TIMEOUT``: после нового поста такая
+    лента показывает приблизительное число, а не пересчитывается.
+    """
+    scope_key = ",".join(scopes)
+    exact_key = COUNT_KEY.format(f"{scope_key}:{get_versions(*scopes)}")
+    estimate_key = COUNT_KEY.format(f"{scope_key}:estimate")
+    cached = cache.get_many([exact_key, estimate_key])
+    if exact_key in cached:
+        return cached[exact_key], False
+    if estimate_key in cached:
+        return cached[estimate_key], True
+    count = queryset.count()
+    cache.set(exact_key, count, settings.FEED_CACHE_TIMEOUT)
+    if count > settings.FEED_COUNT_ESTIMATE_THRESHOLD:
+        cache.set(
+            estimate_key, count, settings.FEED_COUNT_ESTIMATE_TIMEOUT
+        )
+    return count, False
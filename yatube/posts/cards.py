@@ -0,0 +1,77 @@
+"""Кэш отрисованных карточек постов.
+
+Карточка (``includes/post_content.html``) зависит только от поста, его
+автора и группы. Ключ собирается из ``Post.updated`` и отображаемых
+полей автора и группы, поэтому правка поста, смена имени автора или
+адреса группы сами дают новый ключ, а старые карточки просто
+вытесняются. Страница ленты читает все карточки одним ``get_many`` и
+рисует (и ищет миниатюры) только отсутствующие.
+
+Отсутствующие карточки рисуются одним проходом: шаблон находится и
+компилируется один раз, контекст тоже один, в нём меняется только пост.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template import Context, engines
+
+from . import thumbnails
+
+CARD_KEY = "card:{}"
+CARD_TEMPLATE = "includes/post_content.html"
+
+
+def card_key(post, **flags):
+    group = post.group
+    parts = [
+        post.pk,
+        post.updated.isoformat(),
+        post.author.username,
+        post.author.get_full_name(),
+        group.slug if group else "",
+        *sorted(name for name, value in flags.items() if value),
+    ]
+    digest = hashlib.md5(
+        "\x1f".join(map(str, parts)).encode()
+    ).hexdigest()
+    return CARD_KEY.format(digest)
+
+
+def render_cards(posts, **flags):
+    """HTML карточек ``posts`` в том же порядке.
+
+    ``flags`` (``profile_page``, ``group_page``) передаются в шаблон
+    карточки и входят в ключ.
+    """
+    posts = list(posts)
+    keys = [card_key(post, **flags) for post in posts]
+    cards = cache.get_many(keys)
+    missing = [
+        post for post, key in zip(posts, keys) if key not in cards
+    ]
+    if missing:
+        rendered = dict(zip(
+            (card_key(post, **flags) for post in missing),
+            render_posts(missing, **flags),
+        ))
+        cache.set_many(rendered, settings.CARD_CACHE_TIMEOUT)
+        cards.update(rendered)
+    return [cards[key] for key in keys]
+
+
+def render_posts(posts, engine=None, **flags):
+    """HTML карточек ``posts`` без кэша, в том же порядке.
+
+    ``engine`` — движок шаблонов Django, по умолчанию из ``TEMPLATES``.
+    """
+    thumbnails.prefetch(posts, "card")
+    if engine is None:
+        engine = engines["django"].engine
+    template = engine.get_template(CARD_TEMPLATE)
+    context = Context(flags)
+    rendered = []
+    for post in posts:
+        with context.push(post=post):
+            rendered.append(template.render(context))
+    return rendered
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Кэши, которые видит только один процесс.
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии лент в кэше должны быть общими для всех процессов.
+
+    Иначе пост, изменённый в одном процессе, не сбрасывает страницы,
+    ETag и ленты, закэшированные другими. С ``DEBUG`` сервер обычно один
+    и кэш в памяти допустим.
+    """
+    backend = settings.CACHES["default"]["BACKEND"]
+    if backend not in PROCESS_LOCAL_CACHES or settings.DEBUG:
+        return []
+    return [Error(
+        f"Кэш {backend} не общий для процессов сервера.",
+        hint="Укажите в CACHES общий кэш: файловый, memcached или БД.",
+        id="posts.E001",
+    )]
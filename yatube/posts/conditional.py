@@ -0,0 +1,132 @@
+"""Условные GET-запросы и кэш страниц для анонимных посетителей.
+
+ETag страницы собирается из версий областей кэша (см. ``posts.caching``),
+которые сигналы меняют при каждом изменении постов, комментариев и
+подписок. Поэтому ответ 304 отдаётся до выборки постов и рендеринга
+шаблонов: ленте хватает обращения к кэшу, странице группы, профиля или
+поста — ещё одного запроса по уникальному индексу.
+
+Тот же ETag входит в ключ кэша целых страниц для посетителей без сессии.
+Изменение поста меняет версии только его областей, поэтому «сбрасываются»
+лишь страницы, на которых он виден; остальные остаются в кэше, а старые
+версии вытесняются сами, без общего срока жизни.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers,
+    quote_etag,
+)
+
+from . import caching, sharding
+from .models import ArchivedPost, Group, Post
+
+User = get_user_model()
+
+
+PAGE_KEY = "page:{}:{}"
+
+
+def conditional(etag_func):
+    """Отвечает 304, если ETag из ``etag_func`` совпал с ``If-None-Match``.
+
+    Анонимным посетителям отдаёт страницу из кэша, если она там есть.
+    Браузер должен проверять страницу при каждом показе, а страницы
+    авторизованного пользователя — не попадать в общие кэши.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            etag = etag_func(request, *args, **kwargs)
+            if etag is None:
+                return view(request, *args, **kwargs)
+            etag = quote_etag(etag)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = _cached_view(view, etag, request, *args, **kwargs)
+            response.setdefault("ETag", etag)
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ("Cookie",))
+            else:
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def is_anonymous(request):
+    """Посетитель без сессии: проверка не читает сессию из базы."""
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def _cached_view(view, etag, request, *args, **kwargs):
+    if not is_anonymous(request):
+        return view(request, *args, **kwargs)
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = PAGE_KEY.format(etag.strip('"'), path)
+    response = cache.get(key)
+    if response is not None:
+        return response
+    response = view(request, *args, **kwargs)
+    if _is_cacheable(request, response):
+        cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+    return response
+
+
+def _is_cacheable(request, response):
+    # Страница с токеном CSRF или с новыми cookie годится только для
+    # того, кто её запросил.
+    return (
+        response.status_code == 200
+        and not response.cookies
+        and not request.META.get("CSRF_COOKIE_USED")
+    )
+
+
+def index_etag(request):
+    return caching.etag(request, caching.posts_scope())
+
+
+def group_etag(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        "pk", flat=True
+    ).first()
+    if group_id is None:
+        return None
+    return caching.etag(request, caching.group_scope(group_id))
+
+
+def profile_etag(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        "pk", flat=True
+    ).first()
+    if author_id is None:
+        return None
+    scopes = [caching.author_scope(author_id), caching.stats_scope(author_id)]
+    if request.user.is_authenticated:
+        # От подписок зависит кнопка «Подписаться»/«Отписаться».
+        scopes.append(caching.follow_scope(request.user.pk))
+    return caching.etag(request, *scopes)
+
+
+def post_etag(request, post_id):
+    for model in (Post, ArchivedPost):
+        author_id = sharding.for_post(
+            model.objects.filter(pk=post_id), post_id
+        ).values_list("author_id", flat=True).first()
+        if author_id is not None:
+            break
+    else:
+        return None
+    return caching.etag(
+        request,
+        caching.post_scope(post_id),
+        caching.author_scope(author_id),
+    )
@@ -0,0 +1,155 @@
+"""Денормализованные счётчики постов, подписчиков и комментариев.
+
+Счётчики меняются одним ``UPDATE ... SET x = x + 1`` в сигналах записи,
+поэтому одновременные публикации и подписки не теряют изменений.
+Расхождения (например, после ``bulk_create`` или правки базы руками)
+исправляет команда ``reconcile_counters``.
+
+При шардировании посты автора считаются на его шарде, а комментарии —
+на шарде поста (см. ``posts.sharding``). В число постов автора входят и
+архивные (``posts.archive``): профиль показывает их вместе с горячими.
+"""
+from collections import Counter
+
+from django.db import router, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from . import sharding
+from .models import ArchivedPost, AuthorStats, Follow, Post
+from .sharding import POST_TABLES
+
+STATS_COUNTERS = {
+    "posts_count": (Post, "author"),
+    "followers_count": (Follow, "author"),
+    "following_count": (Follow, "user"),
+}
+
+
+def live_count(model, field):
+    """Подзапрос ``COUNT(*)`` строк ``model``, ссылающихся на ``pk``."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by().values(field)
+            .annotate(count=Count("pk")).values("count")
+        ),
+        0,
+    )
+
+
+def add(user_id, **deltas):
+    """Прибавляет ``deltas`` к счётчикам пользователя.
+
+    Если строки ещё нет, ничего не делает: ``stats_for`` посчитает её по
+    живым данным, которые уже включают это изменение.
+    """
+    AuthorStats.objects.filter(user_id=user_id).update(
+        **{name: Greatest(F(name) + delta, 0)
+           for name, delta in deltas.items()}
+    )
+
+
+def stats_for(user_id):
+    """Счётчики пользователя; при первом обращении они считаются.
+
+    Строка создаётся до подсчёта, в той же транзакции, а счётчики
+    заполняются подзапросами в ``UPDATE``. Прибавление из сигнала,
+    пришедшее в это время, ждёт блокировки записи и ложится на уже
+    посчитанную строку, а не пропадает, как при вставке готовых чисел.
+    """
+    stats = AuthorStats.objects.filter(user_id=user_id).first()
+    if stats is not None:
+        return stats
+    # Строка пишется в основную базу; считать её по отстающей реплике
+    # нельзя, иначе расхождение останется до reconcile_counters.
+    using = router.db_for_write(AuthorStats)
+    rows = AuthorStats.objects.using(using)
+    with transaction.atomic(using=using):
+        stats, created = rows.get_or_create(user_id=user_id)
+        if not created:
+            return stats
+        counts = live_counters()
+        if sharding.enabled():
+            counts["posts_count"] = _count_posts(user_id)
+        rows.filter(pk=user_id).update(**counts)
+    stats.refresh_from_db(using=using)
+    return stats
+
+
+def live_counters():
+    """Подзапросы, которые считают счётчики ``AuthorStats`` заново.
+
+    При шардировании посты лежат на шардах и подзапрос в основной базе
+    их не видит, поэтому ``posts_count`` тогда не считается.
+    """
+    live = {
+        name: live_count(model, field)
+        for name, (model, field) in STATS_COUNTERS.items()
+    }
+    if sharding.enabled():
+        del live["posts_count"]
+    else:
+        live["posts_count"] += live_count(ArchivedPost, "author")
+    return live
+
+
+def _count_posts(user_id):
+    return sum(
+        sharding.for_author(
+            posts.objects.filter(author=user_id), user_id
+        ).count()
+        for posts, _ in POST_TABLES
+    )
+
+
+def add_comments(post_id, delta):
+    sharding.for_post(Post.objects.filter(pk=post_id), post_id).update(
+        comments_count=Greatest(F("comments_count") + delta, 0)
+    )
+
+
+def reconcile():
+    """Исправляет разошедшиеся счётчики, возвращает число исправлений.
+
+    Строки с расхождением находятся одним запросом, а новое значение
+    считается подзапросом в самом ``UPDATE``.
+    """
+    fixed = 0
+    if sharding.enabled():
+        fixed += _reconcile_posts_counts()
+    live = live_counters()
+    drifted = AuthorStats.objects.annotate(**{
+        f"live_{name}": count for name, count in live.items()
+    }).exclude(**{name: F(f"live_{name}") for name in live})
+    for user_id in list(drifted.values_list("pk", flat=True)):
+        AuthorStats.objects.filter(pk=user_id).update(**live)
+        fixed += 1
+    for model, comment_model in POST_TABLES:
+        comments = live_count(comment_model, "post")
+        for posts in sharding.each_shard(model.objects.all()):
+            drifted = posts.annotate(live_comments=comments).exclude(
+                comments_count=F("live_comments")
+            )
+            for post_id in list(drifted.values_list("pk", flat=True)):
+                posts.filter(pk=post_id).update(comments_count=comments)
+                fixed += 1
+    return fixed
+
+
+def _reconcile_posts_counts():
+    live = Counter()
+    for model, _ in POST_TABLES:
+        for posts in sharding.each_shard(model.objects.order_by()):
+            live.update(dict(
+                posts.values_list("author").annotate(count=Count("pk"))
+            ))
+    fixed = 0
+    stats = AuthorStats.objects.values_list("pk", "posts_count")
+    for user_id, posts_count in list(stats):
+        if live[user_id] != posts_count:
+            AuthorStats.objects.filter(pk=user_id).update(
+                posts_count=live[user_id]
+            )
+            fixed += 1
+    return fixed
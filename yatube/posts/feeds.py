@@ -0,0 +1,318 @@
+"""Способы сборки ленты подписок, выбираются ``FOLLOW_FEED_BACKEND``.
+
+``inbox`` (fan-out on write): при публикации пост раскладывается в
+``FeedItem`` всех подписчиков автора, поэтому ``follow_index`` читает
+ленту индексным диапазоном по ``(user, pub_date)`` без соединения
+``Follow`` и ``Post``. Посты авторов с числом подписчиков больше
+``FEED_FANOUT_LIMIT`` не раскладываются: такие авторы попадают в
+``PopularAuthor``, а их посты подмешиваются в ленту при чтении.
+
+``pull``: в кэше хранится короткий список последних постов каждого
+автора, лента сливается из списков кучей, и посты загружаются одним
+запросом по ``id``. Запись не множится на число подписчиков.
+
+``join``: соединение ``Follow`` и ``Post`` в базе.
+
+Если посты разнесены по шардам (``posts.sharding``), ``FeedItem`` и
+соединение с ``Follow`` недоступны: лента сливается из постов
+подписок на их шардах, а ``FOLLOW_FEED_BACKEND`` не действует.
+"""
+import heapq
+from itertools import dropwhile, islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Count
+
+from . import caching, sharding
+from .models import FeedItem, Follow, PopularAuthor, Post
+from .paginators import CursorPaginator
+
+BATCH_SIZE = 1000
+AUTHORS_BATCH_SIZE = 500
+RECENT_POSTS_KEY = "feed:recent:{}"
+
+
+def uses(backend):
+    return (
+        settings.FOLLOW_FEED_BACKEND == backend and not sharding.enabled()
+    )
+
+
+def followed_posts(user):
+    """Посты авторов, на которых подписан ``user``."""
+    if not sharding.enabled():
+        return Post.objects.for_feed().filter(author__following__user=user)
+    authors = list(
+        Follow.objects.filter(user=user).values_list("author", flat=True)
+    )
+    return sharding.across_shards(
+        Post.objects.for_feed().filter(author__in=authors),
+        sharding.shards_for(authors),
+    )
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list("user_id", flat=True)[:limit + 1]
+    )
+    if len(followers) > limit:
+        PopularAuthor.objects.get_or_create(author_id=post.author_id)
+        return
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние посты автора после подписки."""
+    if PopularAuthor.objects.filter(author_id=author_id).exists():
+        return
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .order_by("-pub_date", "-pk")
+        .values_list("pk", "pub_date")[:settings.FEED_BACKFILL_LIMIT]
+    )
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    FeedItem.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild(users):
+    """Пересобирает ленты ``users`` и список популярных авторов."""
+    limit = settings.FEED_FANOUT_LIMIT
+    popular = set(
+        Follow.objects.values("author")
+        .annotate(followers=Count("pk"))
+        .filter(followers__gt=limit)
+        .values_list("author", flat=True)
+    )
+    PopularAuthor.objects.exclude(author__in=popular).delete()
+    PopularAuthor.objects.bulk_create(
+        [PopularAuthor(author_id=author_id) for author_id in popular],
+        ignore_conflicts=True,
+    )
+    rebuilt = 0
+    for user in users.iterator():
+        FeedItem.objects.filter(user=user).delete()
+        authors = (
+            Follow.objects.filter(user=user)
+            .exclude(author__in=popular)
+            .values_list("author", flat=True)
+        )
+        for author_id in set(authors):
+            backfill(user.pk, author_id)
+        rebuilt += 1
+    return rebuilt
+
+
+class InboxFeedPaginator(CursorPaginator):
+    """Курсорный вывод ленты подписок из ``FeedItem``.
+
+    Ключ курсора тот же, что у остальных лент, — ``(pub_date, id)``
+    поста, поэтому посты популярных авторов сливаются с лентой по
+    этому ключу.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(Post.objects.for_feed(), per_page)
+        self.user = user
+
+    def fetch(self, values, limit, backward=False):
+        inbox = CursorPaginator(
+            FeedItem.objects.filter(user=self.user)
+            .select_related("post__author", "post__group"),
+            self.per_page,
+            keys=("-pub_date", "-post_id"),
+        )
+        streams = [
+            [item.post for item in inbox.fetch(values, limit, backward)]
+        ]
+        popular = list(PopularAuthor.objects.filter(
+            author__following__user=self.user
+        ).values_list("author", flat=True))
+        if popular:
+            pulled = self.object_list.filter(author__in=popular)
+            streams.append(
+                CursorPaginator(pulled, self.per_page, self.keys)
+                .fetch(values, limit, backward)
+            )
+        merged = heapq.merge(
+            *streams,
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=not backward,
+        )
+        return list(islice(_unique(merged), limit))
+
+
+def recent_posts(author_ids):
+    """Последние посты авторов: ``{author_id: [(pub_date, id), ...]}``.
+
+    Списки отсортированы от новых к старым и содержат не больше
+    ``FEED_RECENT_POSTS`` записей. Они читаются из кэша одним
+    ``get_many``, а недостающие строятся запросом с оконной функцией.
+    """
+    keys = {RECENT_POSTS_KEY.format(author_id): author_id
+            for author_id in author_ids}
+    lists = {
+        keys[key]: entries
+        for key, entries in cache.get_many(list(keys)).items()
+    }
+    missing = [author_id for author_id in author_ids
+               if author_id not in lists]
+    for start in range(0, len(missing), AUTHORS_BATCH_SIZE):
+        loaded = _load_recent_posts(
+            missing[start:start + AUTHORS_BATCH_SIZE]
+        )
+        cache.set_many(
+            {RECENT_POSTS_KEY.format(author_id): entries
+             for author_id, entries in loaded.items()},
+            None,
+        )
+        lists.update(loaded)
+    return lists
+
+
+def _load_recent_posts(author_ids):
+    lists = {author_id: [] for author_id in author_ids}
+    placeholders = ", ".join(["%s"] * len(author_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT author_id, id, pub_date FROM ("
+            f"SELECT author_id, id, pub_date, ROW_NUMBER() OVER ("
+            f"PARTITION BY author_id ORDER BY pub_date DESC, id DESC"
+            f") AS position FROM {Post._meta.db_table} "
+            f"WHERE author_id IN ({placeholders})"
+            f") WHERE position <= %s ORDER BY author_id, position",
+            [*author_ids, settings.FEED_RECENT_POSTS],
+        )
+        for author_id, post_id, pub_date in cursor.fetchall():
+            pub_date = connection.ops.convert_datetimefield_value(
+                pub_date, None, connection
+            )
+            lists[author_id].append((pub_date, post_id))
+    return lists
+
+
+def forget_recent(author_id):
+    """Сбрасывает список последних постов автора.
+
+    Список не дополняется на месте: чтение и запись в кэш не атомарны,
+    и одновременные посты затирали бы друг друга. Следующее чтение
+    строит список заново одним запросом.
+    """
+    caching.now_and_on_commit(
+        cache.delete, RECENT_POSTS_KEY.format(author_id)
+    )
+
+
+class PullFeedPaginator(CursorPaginator):
+    """Лента подписок, слитая из списков последних постов авторов.
+
+    Списки обрезаны, поэтому слияние точно только до «горизонта» —
+    самой новой последней записи среди обрезанных списков. Страницы
+    глубже горизонта собираются соединением в базе.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(Post.objects.for_feed(), per_page)
+        self.user = user
+
+    def fetch(self, values, limit, backward=False):
+        authors = (
+            Follow.objects.filter(user=self.user)
+            .values_list("author", flat=True).distinct()
+        )
+        lists = recent_posts(list(authors))
+        horizon = max(
+            (entries[-1] for entries in lists.values()
+             if len(entries) >= settings.FEED_RECENT_POSTS),
+            default=None,
+        )
+        cursor = tuple(values) if values is not None else None
+        if backward:
+            merged = heapq.merge(*(reversed(entries)
+                                   for entries in lists.values()))
+            keys = list(islice(
+                dropwhile(lambda key: key <= cursor, merged), limit
+            ))
+            exact = horizon is None or cursor >= horizon
+        else:
+            merged = heapq.merge(*lists.values(), reverse=True)
+            if cursor is not None:
+                merged = dropwhile(lambda key: key >= cursor, merged)
+            keys = list(islice(merged, limit))
+            exact = horizon is None or (
+                len(keys) == limit and keys[-1] >= horizon
+            )
+        if not exact:
+            return JoinFeedPaginator(self.user, self.per_page).fetch(
+                values, limit, backward
+            )
+        ids = [post_id for _, post_id in keys]
+        posts = self.object_list.in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+class JoinFeedPaginator(CursorPaginator):
+    """Лента подписок соединением ``Follow`` и ``Post`` в базе.
+
+    Пара ``(user, author)`` в ``Follow`` уникальна, поэтому соединение
+    не размножает посты и ``DISTINCT`` не нужен.
+    При шардировании посты подписок сливаются с их шардов.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(followed_posts(user), per_page)
+        self.user = user
+
+
+FEED_BACKENDS = {
+    "inbox": InboxFeedPaginator,
+    "pull": PullFeedPaginator,
+    "join": JoinFeedPaginator,
+}
+
+
+def follow_paginator(user, per_page):
+    """Курсорный пагинатор ленты подписок по ``FOLLOW_FEED_BACKEND``."""
+    if sharding.enabled():
+        return JoinFeedPaginator(user, per_page)
+    try:
+        paginator_class = FEED_BACKENDS[settings.FOLLOW_FEED_BACKEND]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"Неизвестный FOLLOW_FEED_BACKEND: "
+            f"{settings.FOLLOW_FEED_BACKEND!r}"
+        )
+    return paginator_class(user, per_page)
+
+
+def _unique(posts):
+    seen = set()
+    for post in posts:
+        if post.pk not in seen:
+            seen.add(post.pk)
+            yield post
@@ -1,5 +1,6 @@
 from django import forms
 
+from .images import normalize
 from .models import Post, Comment
 
 
@@ -16,6 +17,14 @@ class PostForm(forms.ModelForm):
             "group": "Группа, к которой будет относиться пост",
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get("image")
+        if image and "image" in self.changed_data:
+            image, before, after = normalize(image)
+            self.instance.image_original_bytes = before
+            self.instance.image_bytes = after
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,56 @@
+"""Нормализация загружаемых картинок постов.
+
+Картинка поворачивается по EXIF, уменьшается до ``IMAGE_MAX_SIZE`` по
+большей стороне и пересохраняется без метаданных: непрозрачная — в
+прогрессивный JPEG, с прозрачностью — в PNG. Небольшие картинки без
+метаданных и анимированные GIF сохраняются как есть.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Поддерживаемые форматы, которые можно хранить без пересохранения.
+KEPT_FORMATS = ("JPEG", "PNG", "GIF")
+
+
+def normalize(upload):
+    """Возвращает ``(файл, размер до, размер после)`` в байтах."""
+    before = upload.size
+    upload.seek(0)
+    image = Image.open(upload)
+    max_size = settings.IMAGE_MAX_SIZE
+    if getattr(image, "is_animated", False) or not (
+        max(image.size) > max_size
+        or image.getexif()
+        or image.format not in KEPT_FORMATS
+    ):
+        upload.seek(0)
+        return upload, before, before
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    buffer = BytesIO()
+    if _has_alpha(image):
+        extension = ".png"
+        # PNG иначе переносит EXIF из исходной картинки.
+        image.save(buffer, "PNG", optimize=True, exif=b"")
+    else:
+        extension = ".jpg"
+        image.convert("RGB").save(
+            buffer, "JPEG",
+            quality=settings.IMAGE_JPEG_QUALITY,
+            optimize=True,
+            progressive=True,
+            # Цветовой профиль оставляем, иначе поплывут цвета.
+            icc_profile=image.info.get("icc_profile"),
+        )
+    name = os.path.splitext(os.path.basename(upload.name))[0] + extension
+    return ContentFile(buffer.getvalue(), name=name), before, buffer.tell()
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
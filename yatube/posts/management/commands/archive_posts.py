@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import archive, sharding
+from posts.models import Comment, Post
+
+KILOBYTE = 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит старые посты с комментариями в архив и показывает, "
+        "насколько уменьшились горячие таблицы. Ленты читают только "
+        "горячие посты, профиль, поиск и страница поста — и архивные."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days", type=int,
+            default=settings.POST_ARCHIVE_AFTER_DAYS,
+            help="Архивировать посты старше стольких дней.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Только посчитать посты, которые уйдут в архив.",
+        )
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(options["older_than_days"])
+        tables = [Post._meta.db_table, Comment._meta.db_table]
+        for alias in sharding.aliases():
+            if options["dry_run"]:
+                count = archive.stale(before, alias).count()
+                self.stdout.write(f"{alias}: к архивации постов {count}")
+                continue
+            started = time.monotonic()
+            sizes = {table: archive.table_size(table, alias)
+                     for table in tables}
+            posts, comments = archive.archive(
+                before, options["batch_size"], alias
+            )
+            self.stdout.write(
+                f"{alias}: в архив перенесено постов {posts}, "
+                f"комментариев {comments} за "
+                f"{time.monotonic() - started:.2f} с"
+            )
+            for table in tables:
+                self.stdout.write(self.shrink(
+                    alias, table, sizes[table],
+                    archive.table_size(table, alias),
+                ))
+
+    def shrink(self, alias, table, old, new):
+        (old_rows, old_bytes), (new_rows, new_bytes) = old, new
+        line = f"{alias}: {table} — строк {old_rows} → {new_rows}"
+        if old_bytes is None or new_bytes is None:
+            return line
+        line += (
+            f", {old_bytes / KILOBYTE:.1f} → {new_bytes / KILOBYTE:.1f} КиБ"
+        )
+        if old_bytes:
+            line += f" ({(new_bytes - old_bytes) / old_bytes:+.0%})"
+        return line
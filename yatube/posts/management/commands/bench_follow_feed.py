@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from posts.benchmarks import best_time, seed_posts, seed_users, throwaway_data
+from posts.feeds import JoinFeedPaginator, PullFeedPaginator
+from posts.models import Follow
+from posts.views import POSTS_PER_PAGE
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает ленту подписок через соединение в базе и слиянием "
+        "кэшированных списков последних постов авторов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--authors", type=int, nargs="+", default=[10, 1000, 10000]
+        )
+        parser.add_argument("--posts-per-author", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'авторов':>8} {'join, мс':>10} {'pull, мс':>10} "
+            f"{'pull без кэша, мс':>18}"
+        )
+        for count in options["authors"]:
+            with throwaway_data():
+                self.run(
+                    count, options["posts_per_author"], options["repeat"]
+                )
+
+    def run(self, count, posts_per_author, repeat):
+        reader, *authors = seed_users(count + 1)
+        Follow.objects.bulk_create(
+            [Follow(user=reader, author=author) for author in authors]
+        )
+        seed_posts(count * posts_per_author, authors)
+        join = JoinFeedPaginator(reader, POSTS_PER_PAGE)
+        pull = PullFeedPaginator(reader, POSTS_PER_PAGE)
+
+        def cold_pull():
+            cache.clear()
+            list(pull.get_page(None))
+
+        join_ms = best_time(lambda: list(join.get_page(None)), repeat)
+        cold_ms = best_time(cold_pull, repeat)
+        pull_ms = best_time(lambda: list(pull.get_page(None)), repeat)
+        self.stdout.write(
+            f"{count:>8} {join_ms:>10.2f} {pull_ms:>10.2f} {cold_ms:>18.2f}"
+        )
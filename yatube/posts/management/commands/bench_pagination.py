@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+
+from posts.benchmarks import best_time, seed_posts, seed_users, throwaway_data
+from posts.models import Post
+from posts.paginators import CursorPaginator
+from posts.views import POSTS_PER_PAGE
+
+
+class Command(BaseCommand):
+    help = "Сравнивает Paginator (OFFSET) и CursorPaginator на главной ленте."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with throwaway_data():
+            self.stdout.write(f"Создаём {options['posts']} постов...")
+            seed_posts(options["posts"], seed_users(10))
+            self.run(Post.objects.all(), options["repeat"])
+
+    def run(self, queryset, repeat):
+        total = queryset.count()
+        last_page = max(1, -(-total // POSTS_PER_PAGE))
+        pages = sorted({1, 10, 100, 1000, last_page // 2, last_page})
+        self.stdout.write(
+            f"{'страница':>10} {'OFFSET, мс':>12} {'курсор, мс':>12}"
+        )
+        for number in [page for page in pages if page <= last_page]:
+            offset_ms = best_time(
+                lambda: list(
+                    Paginator(queryset, POSTS_PER_PAGE).page(number)
+                ),
+                repeat,
+            )
+            cursor = self.cursor_for(queryset, number)
+            cursor_ms = best_time(
+                lambda: list(
+                    CursorPaginator(queryset, POSTS_PER_PAGE).get_page(cursor)
+                ),
+                repeat,
+            )
+            self.stdout.write(
+                f"{number:>10} {offset_ms:>12.2f} {cursor_ms:>12.2f}"
+            )
+
+    @staticmethod
+    def cursor_for(queryset, number):
+        """Курсор, указывающий на начало страницы ``number``."""
+        if number == 1:
+            return None
+        paginator = CursorPaginator(queryset, POSTS_PER_PAGE)
+        previous = queryset.order_by(*paginator.keys)[
+            (number - 1) * POSTS_PER_PAGE - 1
+        ]
+        return paginator.encode_cursor(previous)
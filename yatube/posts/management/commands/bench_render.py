@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine, engines
+
+from posts.benchmarks import best_time, seed_posts, seed_users, throwaway_data
+from posts.cards import CARD_TEMPLATE, render_posts
+from posts.models import Post
+from posts.views import POSTS_PER_PAGE
+
+# Так лента рисовалась раньше: include на каждый пост.
+INCLUDE_LOOP = (
+    "{% for post in page_obj %}"
+    "{% include '" + CARD_TEMPLATE + "' %}"
+    "{% if not forloop.last %}<hr>{% endif %}"
+    "{% endfor %}"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает отрисовку карточек ленты через include и одним "
+        "проходом, с кэширующим загрузчиком шаблонов и без него."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=POSTS_PER_PAGE)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with throwaway_data():
+            seed_posts(options["posts"], seed_users(10))
+            posts = list(Post.objects.for_feed()[:options["posts"]])
+            self.run(posts, options["repeat"])
+
+    def run(self, posts, repeat):
+        engine = engines["django"].engine
+        plain = self.engine(engine, cached=False)
+        cached = self.engine(engine, cached=True)
+        self.stdout.write(
+            f"{'способ':>12} {'без кэша, мс':>14} {'с кэшем, мс':>13}"
+        )
+        for title, render in (
+            ("include", self.include_loop),
+            ("один проход", self.one_pass),
+        ):
+            plain_ms = best_time(lambda: render(plain, posts), repeat)
+            cached_ms = best_time(lambda: render(cached, posts), repeat)
+            self.stdout.write(
+                f"{title:>12} {plain_ms:>14.2f} {cached_ms:>13.2f}"
+            )
+
+    @staticmethod
+    def engine(engine, cached):
+        loaders = [
+            "django.template.loaders.filesystem.Loader",
+            "django.template.loaders.app_directories.Loader",
+        ]
+        if cached:
+            loaders = [("django.template.loaders.cached.Loader", loaders)]
+        return Engine(
+            dirs=engine.dirs,
+            loaders=loaders,
+            libraries=engine.libraries,
+            builtins=engine.builtins,
+        )
+
+    @staticmethod
+    def include_loop(engine, posts):
+        return engine.from_string(INCLUDE_LOOP).render(
+            Context({"page_obj": posts})
+        )
+
+    @staticmethod
+    def one_pass(engine, posts):
+        return render_posts(posts, engine=engine)
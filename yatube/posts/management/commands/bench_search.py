@@ -0,0 +1,60 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from posts.benchmarks import best_time, seed_posts, seed_users, throwaway_data
+from posts.models import Post
+from posts.paginators import CursorPaginator
+from posts.search import SearchPaginator, uses_fts
+from posts.views import POSTS_PER_PAGE
+
+WORDS = (
+    "кошка собака погода город море лес река книга музыка кино "
+    "поезд работа отпуск утро вечер дождь снег солнце чай кофе"
+).split()
+RARE_WORD = "синхрофазотрон"
+RARE_EVERY = 10_000
+
+
+class Command(BaseCommand):
+    help = "Сравнивает поиск FTS5 и icontains по тексту постов."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if not uses_fts():
+            self.stderr.write("Полнотекстовый индекс есть только в SQLite.")
+            return
+        with throwaway_data():
+            self.stdout.write(f"Создаём {options['posts']} постов...")
+            seed_posts(options["posts"], seed_users(10), text=self.text)
+            self.run(options["repeat"])
+
+    @staticmethod
+    def text(index):
+        words = random.Random(index).choices(WORDS, k=12)
+        if index % RARE_EVERY == 0:
+            words.append(RARE_WORD)
+        return " ".join(words)
+
+    def run(self, repeat):
+        self.stdout.write(
+            f"{'запрос':>16} {'icontains, мс':>14} {'FTS5, мс':>10}"
+        )
+        for word in (WORDS[0], RARE_WORD, "нетслова"):
+            like_ms = best_time(
+                lambda: list(CursorPaginator(
+                    Post.objects.filter(text__icontains=word),
+                    POSTS_PER_PAGE,
+                ).get_page(None)),
+                repeat,
+            )
+            fts_ms = best_time(
+                lambda: list(
+                    SearchPaginator(word, POSTS_PER_PAGE).get_page(None)
+                ),
+                repeat,
+            )
+            self.stdout.write(f"{word:>16} {like_ms:>14.2f} {fts_ms:>10.2f}")
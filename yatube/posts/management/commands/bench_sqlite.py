@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+from posts.models import Post
+from posts.views import POSTS_PER_PAGE
+
+User = get_user_model()
+
+BACKENDS = {
+    "обычный": "django.db.backends.sqlite3",
+    "настроенный": "core.backends.sqlite3",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает одновременные чтения ленты и записи постов на обычном "
+        "SQLite и на core.backends.sqlite3 (WAL и прагмы)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100_000)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--seconds", type=float, default=10)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        self.stdout.write(
+            f"{'бэкенд':>12} {'чтений/с':>10} {'записей/с':>10} "
+            f"{'p95 чтения, мс':>15} {'p95 записи, мс':>15} {'ошибок':>7}"
+        )
+        try:
+            for index, (title, engine) in enumerate(BACKENDS.items()):
+                alias = f"bench-{index}"
+                connections.databases[alias] = {
+                    "ENGINE": engine,
+                    "NAME": os.path.join(directory, f"{alias}.sqlite3"),
+                }
+                try:
+                    self.prepare(alias, options["posts"])
+                    self.report(title, self.run(alias, options))
+                finally:
+                    connections[alias].close()
+                    del connections.databases[alias]
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def prepare(self, alias, count):
+        call_command("migrate", database=alias, verbosity=0)
+        self.author = User.objects.db_manager(alias).create(username="bench")
+        Post.objects.using(alias).bulk_create([
+            Post(text=f"Пост {index}", author=self.author)
+            for index in range(count)
+        ])
+
+    def run(self, alias, options):
+        results = {"read": [], "write": [], "errors": 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["seconds"]
+
+        def read():
+            list(Post.objects.using(alias).for_feed()[:POSTS_PER_PAGE])
+
+        def write():
+            with transaction.atomic(using=alias):
+                Post.objects.using(alias).bulk_create(
+                    [Post(text="Новый пост", author=self.author)]
+                )
+
+        def worker(kind, func):
+            timings, errors = [], 0
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        func()
+                    except OperationalError:
+                        errors += 1
+                        continue
+                    timings.append(time.perf_counter() - started)
+            finally:
+                connections[alias].close()
+            with lock:
+                results[kind] += timings
+                results["errors"] += errors
+
+        threads = [
+            threading.Thread(target=worker, args=("read", read))
+            for _ in range(options["readers"])
+        ] + [
+            threading.Thread(target=worker, args=("write", write))
+            for _ in range(options["writers"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results["seconds"] = options["seconds"]
+        return results
+
+    def report(self, title, results):
+        seconds = results["seconds"]
+        self.stdout.write(
+            f"{title:>12} "
+            f"{len(results['read']) / seconds:>10.0f} "
+            f"{len(results['write']) / seconds:>10.0f} "
+            f"{self.p95(results['read']):>15.2f} "
+            f"{self.p95(results['write']):>15.2f} "
+            f"{results['errors']:>7}"
+        )
+
+    @staticmethod
+    def p95(timings):
+        if not timings:
+            return 0
+        return sorted(timings)[int(len(timings) * 0.95)] * 1000
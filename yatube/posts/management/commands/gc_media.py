@@ -0,0 +1,96 @@
+import time
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from posts import media
+
+MEGABYTE = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет картинки, на которые не ссылается ни один пост, "
+        "их миниатюры и записи в хранилище ключей sorl."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Только показать, что будет удалено.",
+        )
+        parser.add_argument(
+            "--min-age", type=int, default=60 * 60,
+            help="Не трогать файлы моложе стольких секунд.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.dry_run = options["dry_run"]
+        self.verbosity = options["verbosity"]
+        batch_size = options["batch_size"]
+        self.run(
+            "Картинки",
+            media.orphaned_originals(options["min_age"], batch_size),
+            self.remove_original,
+        )
+        if not media.uses_db_kvstore():
+            self.stderr.write(
+                "Хранилище ключей sorl не в базе, миниатюры не проверяются."
+            )
+            return
+        self.run(
+            "Ключи sorl",
+            media.orphaned_sources(batch_size),
+            self.remove_source,
+        )
+        self.run(
+            "Миниатюры",
+            media.orphaned_thumbnails(options["min_age"], batch_size),
+            self.remove_thumbnail,
+        )
+
+    def run(self, title, batches, remove):
+        started = time.monotonic()
+        scanned = removed = freed = 0
+        for count, orphans in batches:
+            scanned += count
+            for orphan in orphans:
+                size = remove(orphan)
+                if size is not None:
+                    removed += 1
+                    freed += size
+            if self.verbosity > 1:
+                self.stdout.write(
+                    f"{title}: просмотрено {scanned}, удалено {removed}"
+                )
+        elapsed = time.monotonic() - started
+        action = "к удалению" if self.dry_run else "удалено"
+        self.stdout.write(
+            f"{title}: просмотрено {scanned}, {action} {removed} "
+            f"({freed / MEGABYTE:.1f} МБ) за {elapsed:.1f} с, "
+            f"{scanned / max(elapsed, 1e-6):.0f} в секунду"
+        )
+
+    def remove_original(self, orphan):
+        name, size = orphan
+        if self.verbosity > 2:
+            self.stdout.write(name)
+        if self.dry_run or media.remove_original(name):
+            return size
+        return None
+
+    def remove_source(self, image):
+        if self.verbosity > 2:
+            self.stdout.write(image.name)
+        if not self.dry_run:
+            default.kvstore.delete(image)
+        return 0
+
+    def remove_thumbnail(self, orphan):
+        name, size = orphan
+        if self.verbosity > 2:
+            self.stdout.write(name)
+        if not self.dry_run:
+            default.storage.delete(name)
+        return size
@@ -0,0 +1,150 @@
+import time
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from posts import sharding
+from posts.models import CommentId, PostLocation
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит посты (и архивные тоже) с их комментариями на шарды, "
+        "которые им назначает текущий POST_SHARDS. Запускается сразу "
+        "после включения шардирования (заодно выдаёт номера уже созданным "
+        "постам и комментариям), добавления или удаления шарда; повторный "
+        "запуск ничего не меняет."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from", action="append", default=[], dest="drain",
+            help="Бывший шард, с которого нужно забрать все посты.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Только посчитать посты, которые нужно перенести.",
+        )
+
+    def handle(self, *args, **options):
+        shards = sharding.aliases()
+        sources = shards + [
+            alias for alias in options["drain"] if alias not in shards
+        ]
+        unknown = [alias for alias in sources
+                   if alias not in connections.databases]
+        if unknown:
+            raise CommandError(f"Нет таких баз: {', '.join(unknown)}")
+        verb = "к переносу" if options["dry_run"] else "перенесено"
+        for source in sources:
+            started = time.monotonic()
+            moved = Counter()
+            for tables in sharding.POST_TABLES:
+                self.rebalance(source, shards, tables, moved, options)
+            for target in sorted({target for target, _ in moved}):
+                self.stdout.write(
+                    f"{source} → {target}: {verb} постов "
+                    f"{moved[target, 'posts']}, комментариев "
+                    f"{moved[target, 'comments']}"
+                )
+            self.stdout.write(
+                f"{source}: готово за {time.monotonic() - started:.2f} с"
+            )
+
+    def rebalance(self, source, shards, tables, moved, options):
+        post_model, comment_model = tables
+        if not options["dry_run"]:
+            self.register_comments(source, comment_model)
+        for batch in self.misplaced(source, shards, post_model,
+                                    options["batch_size"],
+                                    register=not options["dry_run"]):
+            targets = defaultdict(list)
+            for post_id, target in batch:
+                targets[target].append(post_id)
+            for target, post_ids in targets.items():
+                moved[target, "posts"] += len(post_ids)
+                if options["dry_run"]:
+                    continue
+                moved[target, "comments"] += self.move(
+                    source, target, post_ids, tables
+                )
+
+    def misplaced(self, source, shards, model, batch_size, register=True):
+        """Пачки ``(id поста, шард)`` постов не на своём шарде.
+
+        Посты, созданные до шардирования, заодно записываются в
+        ``PostLocation``, и новые номера не совпадут с их ``id``.
+        """
+        posts = model.objects.using(source).order_by("pk")
+        last_id = 0
+        while True:
+            rows = list(
+                posts.filter(pk__gt=last_id)
+                .values_list("pk", "author_id")[:batch_size]
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            if register:
+                PostLocation.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+                    [PostLocation(pk=post_id, author_id=author_id)
+                     for post_id, author_id in rows],
+                    ignore_conflicts=True,
+                )
+            batch = [
+                (post_id, sharding.shard_for(author_id, shards))
+                for post_id, author_id in rows
+            ]
+            yield [(post_id, target) for post_id, target in batch
+                   if target != source]
+
+    def register_comments(self, source, model):
+        """Сдвигает счётчик номеров комментариев за уже созданные."""
+        last_id = model.objects.using(source).aggregate(
+            last_id=Max("pk")
+        )["last_id"]
+        if last_id is not None:
+            CommentId.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+                [CommentId(pk=last_id)], ignore_conflicts=True
+            )
+
+    def move(self, source, target, post_ids, tables):
+        """Копирует посты с комментариями и удаляет их с ``source``.
+
+        Транзакция на ``source`` начинается с блокировки записи, поэтому
+        комментарий к переносимому посту не потеряется между копированием
+        и удалением. Строки копируются со своими ``id`` и без сигналов:
+        для счётчиков и кэшей пост не меняется.
+        """
+        post_model, comment_model = tables
+        with transaction.atomic(using=source):
+            posts = list(
+                post_model.objects.using(source).filter(pk__in=post_ids)
+            )
+            comments = list(
+                comment_model.objects.using(source)
+                .filter(post_id__in=post_ids)
+            )
+            with transaction.atomic(using=target):
+                post_model.objects.using(target).bulk_create(
+                    posts, ignore_conflicts=True
+                )
+                comment_model.objects.using(target).bulk_create(
+                    comments, ignore_conflicts=True
+                )
+            placeholders = ", ".join(["%s"] * len(post_ids))
+            with connections[source].cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {comment_model._meta.db_table} "
+                    f"WHERE post_id IN ({placeholders})",
+                    post_ids,
+                )
+                cursor.execute(
+                    f"DELETE FROM {post_model._meta.db_table} "
+                    f"WHERE id IN ({placeholders})",
+                    post_ids,
+                )
+        return len(comments)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики постов, подписчиков и комментариев."
+
+    def handle(self, *args, **options):
+        fixed = counters.reconcile()
+        self.stdout.write(f"Исправлено счётчиков: {fixed}")
@@ -0,0 +1,214 @@
+"""Счётчики ссылок постов на файлы картинок.
+
+Одинаковые загрузки хранятся одним файлом (см. ``posts.storage``),
+поэтому файл удаляется только тогда, когда на него не ссылается ни один
+пост. Счётчик меняется выражениями F() в сигналах записи ``Post``, сам
+файл и его миниатюры удаляются после фиксации транзакции, если за это
+время на него не сослались снова (``delete_unused``).
+
+Файлы, которые остались без постов в обход счётчиков (удалены до
+появления счётчиков, сохранены транзакцией, которая потом откатилась),
+находит сборщик мусора — команда ``gc_media``. Он идёт по файлам и
+хранилищу ключей sorl пачками, поэтому память не растёт с числом файлов.
+"""
+import logging
+import os
+import time
+from itertools import islice
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import sharding, thumbnails
+from .models import ArchivedPost, MediaFile, Post
+
+logger = logging.getLogger(__name__)
+
+
+def retain(name):
+    """Добавляет ссылку на файл ``name``."""
+    updated = MediaFile.objects.filter(name=name).update(refs=F("refs") + 1)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            MediaFile.objects.create(name=name, refs=1)
+    except IntegrityError:
+        MediaFile.objects.filter(name=name).update(refs=F("refs") + 1)
+
+
+def release(name):
+    """Убирает ссылку на файл ``name``; последняя удаляет сам файл."""
+    MediaFile.objects.filter(name=name, refs__gt=0).update(
+        refs=F("refs") - 1
+    )
+    deleted, _ = MediaFile.objects.filter(name=name, refs=0).delete()
+    if deleted:
+        released = time.time()
+        transaction.on_commit(lambda: delete_unused(name, released))
+
+
+def delete_unused(name, released):
+    """Удаляет файл ``name``, если после ``released`` он снова не нужен.
+
+    Пока удаление ждало фиксации, те же байты могли загрузить снова:
+    хранилище тогда берёт готовый файл и обновляет дату его изменения
+    (см. ``ContentAddressedStorage._save``). Поэтому под блокировкой
+    записи, под которой хранилище и сохраняет файлы, перечитываются
+    счётчик и дата изменения файла.
+    """
+    storage = Post._meta.get_field("image").storage
+    with transaction.atomic():
+        refs = MediaFile.objects.select_for_update().filter(
+            name=name
+        ).values_list("refs", flat=True).first()
+        if refs:
+            return
+        try:
+            if os.path.getmtime(storage.path(name)) >= released:
+                return
+        except (SuspiciousFileOperation, OSError):
+            pass
+        delete_file(name)
+
+
+def delete_file(name):
+    """Удаляет файл, его миниатюры и записи о них в хранилище sorl."""
+    image = thumbnails.source(name)
+    try:
+        default.kvstore.delete(image)
+        image.storage.delete(name)
+    except (SuspiciousFileOperation, OSError):
+        logger.exception("Не удалось удалить %s", name)
+
+
+def walk(storage, directory):
+    """Файлы каталога ``directory`` хранилища: ``(имя, размер, mtime)``.
+
+    ``os.scandir`` читает каталог потоком, в отличие от
+    ``storage.listdir``, которая возвращает его целиком.
+    """
+    try:
+        entries = os.scandir(storage.path(directory))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            name = f"{directory}/{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(storage, name)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat()
+                yield name, stat.st_size, stat.st_mtime
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def referenced(names):
+    """Имена из ``names``, на которые ссылается хоть один пост.
+
+    Архивные посты (``posts.archive``) тоже считаются.
+    """
+    found = set()
+    for model in (Post, ArchivedPost):
+        for posts in sharding.each_shard(
+            model.objects.filter(image__in=names)
+        ):
+            found.update(posts.values_list("image", flat=True))
+    return found
+
+
+def orphaned_originals(min_age, batch_size):
+    """Исходные картинки, на которые не ссылается ни один пост.
+
+    Как и остальные ``orphaned_*``, отдаёт по пачке ``(сколько
+    просмотрено, [(имя, размер), ...])``. Файлы моложе ``min_age``
+    секунд пропускаются: пост, который их загрузил, может быть ещё не
+    сохранён.
+    """
+    field = Post._meta.get_field("image")
+    storage = field.storage
+    directory = field.upload_to.rstrip("/")
+    deadline = time.time() - min_age
+    for batch in batches(walk(storage, directory), batch_size):
+        names = referenced([name for name, _, _ in batch])
+        yield len(batch), [
+            (name, size) for name, size, mtime in batch
+            if name not in names and mtime < deadline
+        ]
+
+
+def remove_original(name):
+    """Удаляет файл без постов вместе с миниатюрами и счётчиком."""
+    if referenced([name]):
+        return False
+    MediaFile.objects.filter(name=name).delete()
+    delete_file(name)
+    return True
+
+
+def orphaned_sources(batch_size):
+    """Исходники в хранилище ключей sorl, которых нет ни у одного поста.
+
+    Ключи читаются по порядку пачками, начиная с последнего
+    прочитанного, поэтому удаление по ходу обхода ничего не пропускает.
+    """
+    prefix = add_prefix("")
+    last = prefix
+    while True:
+        rows = list(
+            KVStoreModel.objects
+            .filter(key__startswith=prefix, key__gt=last)
+            .order_by("key").values_list("key", "value")[:batch_size]
+        )
+        if not rows:
+            return
+        last = rows[-1][0]
+        sources = [
+            image for image in (
+                deserialize_image_file(value) for _, value in rows
+            )
+            if not image.name.startswith(sorl_settings.THUMBNAIL_PREFIX)
+        ]
+        names = referenced([image.name for image in sources])
+        yield len(rows), [
+            image for image in sources if image.name not in names
+        ]
+
+
+def orphaned_thumbnails(min_age, batch_size):
+    """Файлы миниатюр, о которых не знает хранилище ключей sorl."""
+    storage = default.storage
+    directory = sorl_settings.THUMBNAIL_PREFIX.rstrip("/")
+    deadline = time.time() - min_age
+    for batch in batches(walk(storage, directory), batch_size):
+        keys = {
+            add_prefix(ImageFile(name, storage).key): (name, size, mtime)
+            for name, size, mtime in batch
+        }
+        known = set(
+            KVStoreModel.objects.filter(key__in=list(keys))
+            .values_list("key", flat=True)
+        )
+        yield len(batch), [
+            (name, size) for key, (name, size, mtime) in keys.items()
+            if key not in known and mtime < deadline
+        ]
+
+
+def uses_db_kvstore():
+    return isinstance(default.kvstore, KVStore)
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_bytes',
+            field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Размер сохранённой картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_original_bytes',
+            field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Размер загруженной картинки'),
+        ),
+    ]
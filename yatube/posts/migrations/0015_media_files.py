@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:28
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def count_refs(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    # Старые файлы остаются под прежними именами, дубликаты среди них
+    # не ищем: у каждого имени просто своё число ссылок.
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    Post = apps.get_model('posts', 'Post')
+    refs = (
+        Post.objects.using(db_alias).exclude(image='').values('image')
+        .annotate(refs=Count('pk')).order_by()
+    )
+    MediaFile.objects.using(db_alias).bulk_create(
+        (MediaFile(name=row['image'], refs=row['refs']) for row in refs),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_image_sizes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(count_refs, migrations.RunPython.noop),
+    ]
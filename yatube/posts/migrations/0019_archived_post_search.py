@@ -0,0 +1,73 @@
+from django.db import migrations
+
+# SQL записан как есть: миграция не должна меняться вместе с posts.search.
+CREATE_TABLE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_archivedpost_fts USING fts5(
+        text,
+        content='posts_archivedpost',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_archivedpost_fts_insert
+    AFTER INSERT ON posts_archivedpost BEGIN
+        INSERT INTO posts_archivedpost_fts(rowid, text)
+        VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_archivedpost_fts_delete
+    AFTER DELETE ON posts_archivedpost BEGIN
+        INSERT INTO posts_archivedpost_fts(posts_archivedpost_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_archivedpost_fts_update
+    AFTER UPDATE OF text ON posts_archivedpost BEGIN
+        INSERT INTO posts_archivedpost_fts(posts_archivedpost_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_archivedpost_fts(rowid, text)
+        VALUES (new.id, new.text);
+    END
+    """,
+]
+REBUILD_SQL = (
+    "INSERT INTO posts_archivedpost_fts(posts_archivedpost_fts) "
+    "VALUES ('rebuild')"
+)
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS posts_archivedpost_fts_insert",
+    "DROP TRIGGER IF EXISTS posts_archivedpost_fts_delete",
+    "DROP TRIGGER IF EXISTS posts_archivedpost_fts_update",
+    "DROP TABLE IF EXISTS posts_archivedpost_fts",
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(CREATE_TABLE_SQL)
+    for statement in TRIGGERS_SQL:
+        schema_editor.execute(statement)
+    schema_editor.execute(REBUILD_SQL)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_post_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 
 User = get_user_model()
 
@@ -14,17 +17,40 @@ class Group(models.Model):
         return self.title
 
 
+class RoutedQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # QuerySet.create выбирает базу до создания объекта, а шард поста
+        # зависит от его полей, см. posts.sharding.ShardRouter.
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
+class PostQuerySet(RoutedQuerySet):
+    def for_feed(self):
+        """Посты вместе с автором и группой, которые выводит карточка.
+
+        На шардах нет пользователей и групп: они догружаются из
+        основной базы вторым запросом.
+        """
+        if settings.POST_SHARDS:
+            return self.prefetch_related("author", "group")
+        return self.select_related("author", "group")
+
+
 class Post(models.Model):
     text = models.TextField("Текст поста", help_text="Введите текст поста")
     pub_date = models.DateTimeField("Дата публикации", auto_now_add=True)
     author = models.ForeignKey(
-        User, on_delete=models.CASCADE,
+        User, on_delete=models.CASCADE, db_index=False,
         verbose_name="Автор", related_name="posts"
     )
     group = models.ForeignKey(
         Group,
         blank=True,
         null=True,
+        db_index=False,
         on_delete=models.SET_NULL,
         verbose_name="Группа",
         help_text="Группа, к которой будет относиться пост",
@@ -33,21 +59,82 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    image_original_bytes = models.PositiveIntegerField(
+        "Размер загруженной картинки", null=True, editable=False
+    )
+    image_bytes = models.PositiveIntegerField(
+        "Размер сохранённой картинки", null=True, editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        "Число комментариев", default=0, editable=False
+    )
+    # Входит в ключ закэшированной карточки поста.
+    updated = models.DateTimeField("Дата изменения", auto_now=True)
+
+    objects = PostQuerySet.as_manager()
+
+    # Архивные посты (ArchivedPost) только для чтения.
+    archived = False
+
+    # Счётчики меняются только выражениями F(), поэтому сохранение
+    # загруженного поста не должно перезаписывать их старым значением.
+    COUNTER_FIELDS = ("comments_count",)
 
     class Meta:
         ordering = [
             "-pub_date",
         ]
+        # Индексы (x, pub_date) SQLite читает в обратном порядке: это
+        # и есть порядок ленты (pub_date DESC, id DESC). Они же заменяют
+        # одиночные индексы внешних ключей.
+        indexes = [
+            models.Index(fields=["pub_date"], name="post_pub_date_idx"),
+            models.Index(
+                fields=["author", "pub_date"],
+                name="post_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=["group", "pub_date"],
+                name="post_group_pub_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        self._loaded_group_id = self.group_id
+        self._loaded_image = self.image.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Группа до изменения нужна, чтобы сбросить кэш её ленты,
+        # а картинка — чтобы не генерировать миниатюры повторно и
+        # правильно считать ссылки на файл.
+        instance._loaded_group_id = instance.__dict__.get("group_id")
+        instance._loaded_image = instance.__dict__.get("image")
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_group_id = self.group_id
+        self._loaded_image = self.image.name
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE,
-                             related_name="comments")
+                             db_index=False, related_name="comments")
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
         related_name="comments"
@@ -55,9 +142,158 @@ class Comment(models.Model):
     text = models.TextField("Текст комментария")
     created = models.DateTimeField("Дата публикации", auto_now_add=True)
 
+    objects = RoutedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["post", "created"],
+                name="comment_post_created_idx",
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,
-                             related_name="follower")
+                             db_index=False, related_name="follower")
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name="following")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "author"], name="unique_follow"
+            ),
+        ]
+
+
+class FeedItem(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name="feed_items")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name="feed_items")
+    pub_date = models.DateTimeField("Дата публикации")
+
+    class Meta:
+        ordering = ["-pub_date", "-post_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"], name="unique_feed_item"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "pub_date", "post"],
+                name="feed_item_user_pub_date_idx",
+            ),
+        ]
+
+
+class PopularAuthor(models.Model):
+    """Автор, у которого слишком много подписчиков для рассылки постов.
+
+    Его посты не раскладываются по лентам при публикации, а
+    подмешиваются в ленту подписчиков при чтении.
+    """
+    author = models.OneToOneField(User, on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name="popular")
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Строка создаётся при первом обращении по живым данным, дальше
+    счётчики меняются сигналами записи, см. ``posts.counters``.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name="stats")
+    posts_count = models.PositiveIntegerField("Число постов", default=0)
+    followers_count = models.PositiveIntegerField(
+        "Число подписчиков", default=0
+    )
+    following_count = models.PositiveIntegerField(
+        "Число подписок", default=0
+    )
+
+
+class MediaFile(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются."""
+    name = models.CharField(max_length=255, primary_key=True)
+    refs = models.PositiveIntegerField("Число ссылок", default=0)
+
+
+class PostLocation(models.Model):
+    """Номер поста, выданный при шардировании, и автор поста.
+
+    На шардах у постов нет общего счётчика, поэтому ``id`` выдаёт эта
+    таблица в основной базе. По автору же находится шард поста, см.
+    ``posts.sharding``.
+    """
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="+")
+
+
+class CommentId(models.Model):
+    """Номер комментария, уникальный на всех шардах."""
+
+
+class ArchivedPost(models.Model):
+    """Старый пост, перенесённый командой ``archive_posts``.
+
+    Поля повторяют ``Post``, ``id`` и даты сохраняются прежними. Ленты
+    читают только ``Post``, а профиль, поиск и страница поста — обе
+    таблицы, см. ``posts.archive``. Архивный пост нельзя изменить или
+    прокомментировать.
+    """
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField("Текст поста")
+    pub_date = models.DateTimeField("Дата публикации")
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               db_index=False, related_name="+")
+    group = models.ForeignKey(Group, null=True, on_delete=models.SET_NULL,
+                              related_name="+")
+    image = models.ImageField(
+        "Картинка", upload_to="posts/", storage=ContentAddressedStorage(),
+        blank=True
+    )
+    image_original_bytes = models.PositiveIntegerField(null=True)
+    image_bytes = models.PositiveIntegerField(null=True)
+    comments_count = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField("Дата изменения")
+
+    objects = PostQuerySet.as_manager()
+
+    archived = True
+
+    class Meta:
+        ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=["author", "pub_date"],
+                name="archived_post_author_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return self.text[:15]
+
+
+class ArchivedComment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE,
+                             db_index=False, related_name="comments")
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="+")
+    text = models.TextField("Текст комментария")
+    created = models.DateTimeField("Дата публикации")
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["post", "created"],
+                name="archived_comment_post_idx",
+            ),
+        ]
@@ -0,0 +1,176 @@
+import base64
+import binascii
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_SEPARATOR = "|"
+CURSOR_FORWARD = "n"
+CURSOR_BACKWARD = "p"
+ELLIPSIS = "…"
+
+
+class CountingPaginator(Paginator):
+    """Постраничный вывод с заранее известным числом записей.
+
+    ``count`` — число или функция, возвращающая ``(число, приблизительно
+    ли оно)``, например ``caching.cached_count``. ``COUNT(*)`` по
+    ``object_list`` не выполняется.
+
+    У страниц есть ``elided_page_range`` — номера для ссылок: первые,
+    последние и окно вокруг текущей, пропуски заменены на ``ELLIPSIS``.
+    Ссылок всегда не больше ``2 * (on_each_side + on_ends) + 3``, сколько
+    бы ни было страниц.
+    """
+
+    ELLIPSIS = ELLIPSIS
+    on_each_side = 3
+    on_ends = 2
+
+    def __init__(self, object_list, per_page, count):
+        super().__init__(object_list, per_page)
+        self._count = count
+        self.count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        if not callable(self._count):
+            return self._count
+        count, self.count_is_estimate = self._count()
+        return count
+
+    def page(self, number):
+        page = super().page(number)
+        page.elided_page_range = list(
+            self.get_elided_page_range(page.number)
+        )
+        return page
+
+    def get_elided_page_range(self, number):
+        """Номера страниц вокруг ``number`` с пропусками."""
+        num_pages = self.num_pages
+        on_each_side, on_ends = self.on_each_side, self.on_ends
+        if num_pages <= 2 * (on_each_side + on_ends) + 1:
+            yield from self.page_range
+            return
+        if number > on_ends + on_each_side + 2:
+            yield from range(1, on_ends + 1)
+            yield ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield ELLIPSIS
+            yield from range(num_pages - on_ends + 1, num_pages + 1)
+        else:
+            yield from range(number + 1, num_pages + 1)
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по курсору (keyset) вместо номера страницы.
+
+    Страница выбирается условием по ключу сортировки, например
+    ``(pub_date, id)``, и запрашивается ``per_page + 1`` записей, чтобы
+    узнать, есть ли следующая страница. ``COUNT(*)`` и ``OFFSET`` не
+    выполняются, поэтому глубокие страницы стоят столько же, сколько
+    первая, а ссылки не «съезжают» при появлении новых записей.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, keys=("-pub_date", "-pk")):
+        super().__init__(object_list, per_page)
+        self.keys = tuple(keys)
+
+    def get_page(self, cursor):
+        """Возвращает страницу для курсора; битый курсор — первая страница."""
+        direction, values = self.decode_cursor(cursor)
+        backward = direction == CURSOR_BACKWARD
+        rows = self.fetch(values, self.per_page + 1, backward=backward)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backward:
+            rows.reverse()
+        page = self._get_page(rows, 1, self)
+        if backward:
+            has_next, has_previous = bool(rows), has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        page.next_cursor = (
+            self.encode_cursor(rows[-1]) if has_next and rows else None
+        )
+        page.previous_cursor = (
+            self.encode_cursor(rows[0], CURSOR_BACKWARD)
+            if has_previous and rows else None
+        )
+        return page
+
+    def fetch(self, values, limit, backward=False):
+        """Выбирает ``limit`` записей, следующих за ключом ``values``."""
+        ordering = [
+            self._reverse_key(key) if backward else key for key in self.keys
+        ]
+        queryset = self.object_list.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, backward))
+        return list(queryset[:limit])
+
+    def keyset_filter(self, values, backward=False):
+        """Условие «строго после ключа ``values``» в порядке сортировки.
+
+        Для ``(-pub_date, -pk)`` это ``pub_date <= d AND (pub_date < d OR
+        (pub_date = d AND id < i))``: первое слагаемое — диапазон по
+        индексу, с которого SQLite начинает сканирование.
+        """
+        names = [key.lstrip("-") for key in self.keys]
+        lookups = [
+            "lt" if key.startswith("-") != backward else "gt"
+            for key in self.keys
+        ]
+        after = Q()
+        for index, (name, lookup) in enumerate(zip(names, lookups)):
+            condition = Q(**{f"{name}__{lookup}": values[index]})
+            for prev_name, prev_value in zip(names[:index], values):
+                condition &= Q(**{prev_name: prev_value})
+            after |= condition
+        return Q(**{f"{names[0]}__{lookups[0]}e": values[0]}) & after
+
+    def encode_cursor(self, obj, direction=CURSOR_FORWARD):
+        values = [
+            self._field(key).value_to_string(obj) for key in self.keys
+        ]
+        raw = CURSOR_SEPARATOR.join([direction] + values)
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        """Разбирает курсор в ``(направление, значения)``."""
+        if not cursor:
+            return CURSOR_FORWARD, None
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            direction, *parts = raw.split(CURSOR_SEPARATOR)
+            if (
+                direction not in (CURSOR_FORWARD, CURSOR_BACKWARD)
+                or len(parts) != len(self.keys)
+            ):
+                raise ValueError
+            values = [
+                self._field(key).to_python(part)
+                for key, part in zip(self.keys, parts)
+            ]
+        except (ValueError, ValidationError, binascii.Error):
+            return CURSOR_FORWARD, None
+        return direction, values
+
+    def _field(self, key):
+        name = key.lstrip("-")
+        opts = self.object_list.model._meta
+        return opts.pk if name == "pk" else opts.get_field(name)
+
+    @staticmethod
+    def _reverse_key(key):
+        return key[1:] if key.startswith("-") else f"-{key}"
@@ -0,0 +1,204 @@
+"""Полнотекстовый поиск по постам.
+
+В SQLite текст постов индексируется виртуальной таблицей FTS5
+``posts_post_fts`` с внешним содержимым: сам текст хранится в
+``posts_post``, а триггеры обновляют индекс при любой записи, включая
+``bulk_create`` и ``UPDATE``. Результаты упорядочены по релевантности
+(``bm25``) и листаются курсором по ``(rank, id)``. На других базах поиск
+сводится к ``icontains``.
+
+Архивные посты (``posts.archive``) индексируются так же, своей таблицей
+``posts_archivedpost_fts``, и ищутся вместе с горячими. У каждого шарда
+(``posts.sharding``) свои индексы. Выдачи всех индексов сливаются по
+``rank``; ``bm25`` считается по словам своего индекса, поэтому ранги
+разных индексов сравнимы лишь приблизительно.
+"""
+import heapq
+import re
+from itertools import islice
+
+from django.db import connection, connections, models
+
+from . import sharding
+from .models import ArchivedPost, Post
+from .paginators import CursorPaginator
+from .sharding import MergedQuerySet
+
+# Индекс FTS5 каждой таблицы постов.
+FTS_TABLES = {
+    Post: "posts_post_fts",
+    ArchivedPost: "posts_archivedpost_fts",
+}
+FTS_TABLE = FTS_TABLES[Post]
+
+
+def create_table_sql(model):
+    fts = FTS_TABLES[model]
+    return f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            text,
+            content='{model._meta.db_table}',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """
+
+
+def triggers_sql(model):
+    """Триггеры, которые обновляют индекс таблицы ``model``.
+
+    Django пересоздаёт таблицу при изменении модели в SQLite, и триггеры
+    удаляются вместе со старой таблицей, поэтому они восстанавливаются
+    после каждой миграции, см. ``install_triggers``.
+    """
+    fts, table = FTS_TABLES[model], model._meta.db_table
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert
+        AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete
+        AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_update
+        AFTER UPDATE OF text ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+        END
+        """,
+    ]
+
+
+WORD_RE = re.compile(r"\w+")
+
+RANK_FIELD = models.FloatField()
+RANK_FIELD.set_attributes_from_name("rank")
+
+
+def uses_fts(conn=connection):
+    return conn.vendor == "sqlite"
+
+
+def install_triggers(using="default", **kwargs):
+    """Создаёт недостающие триггеры индексов, обработчик ``post_migrate``."""
+    conn = connections[using]
+    if not uses_fts(conn):
+        return
+    with conn.cursor() as cursor:
+        for model in FTS_TABLES:
+            if _has_fts_table(cursor, model):
+                for statement in triggers_sql(model):
+                    cursor.execute(statement)
+
+
+def _has_fts_table(cursor, model):
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+        [FTS_TABLES[model]],
+    )
+    return cursor.fetchone() is not None
+
+
+def match_expression(query):
+    """Переводит строку поиска в запрос FTS5.
+
+    Берутся только слова, каждое в кавычках и с поиском по префиксу,
+    поэтому операторы и кавычки из ввода не ломают синтаксис MATCH.
+    """
+    return " ".join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+def filter_matching(posts, query):
+    """Оставляет в ``posts`` только подходящие под ``query`` посты."""
+    # RawSQL внутри ``pk__in`` Django оборачивает в лишние скобки, и
+    # подзапрос становится скалярным, поэтому условие задаётся через extra.
+    return posts.extra(
+        where=[
+            f"{Post._meta.db_table}.id IN (SELECT rowid FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s)"
+        ],
+        params=[match_expression(query)],
+    )
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорный вывод результатов поиска по ``(rank, id)``.
+
+    Чем меньше ``rank`` (``bm25``), тем выше пост в выдаче. Страница
+    выбирается из индексов FTS5 горячих и архивных постов, посты
+    загружаются одним запросом по ``id`` на индекс.
+    """
+
+    def __init__(self, query, per_page):
+        super().__init__(Post.objects.for_feed(), per_page,
+                         keys=("rank", "pk"))
+        self.match = match_expression(query)
+
+    def fetch(self, values, limit, backward=False):
+        if not self.match:
+            return []
+        streams = [
+            self.fetch_shard(alias, values, limit, backward, model)
+            for alias in sharding.aliases()
+            for model in FTS_TABLES
+        ]
+        if len(streams) == 1:
+            return streams[0]
+        merged = heapq.merge(
+            *streams, key=lambda post: (post.rank, post.pk), reverse=backward
+        )
+        return list(islice(merged, limit))
+
+    def fetch_shard(self, alias, values, limit, backward=False, model=Post):
+        fts = FTS_TABLES[model]
+        order = "DESC" if backward else "ASC"
+        sql = f"SELECT rowid, rank FROM {fts} WHERE {fts} MATCH %s"
+        params = [self.match]
+        if values is not None:
+            compare = "<" if backward else ">"
+            sql += (
+                f" AND (rank {compare} %s"
+                f" OR (rank = %s AND rowid {compare} %s))"
+            )
+            params += [values[0], values[0], values[1]]
+        sql += f" ORDER BY rank {order}, rowid {order} LIMIT %s"
+        params.append(limit)
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, params)
+            ranks = cursor.fetchall()
+        posts = model.objects.for_feed().using(alias).in_bulk(
+            [post_id for post_id, _ in ranks]
+        )
+        found = []
+        for post_id, rank in ranks:
+            if post_id in posts:
+                posts[post_id].rank = rank
+                found.append(posts[post_id])
+        return found
+
+    def _field(self, key):
+        if key == "rank":
+            return RANK_FIELD
+        return super()._field(key)
+
+
+def search_paginator(query, per_page):
+    """Пагинатор результатов поиска для текущей базы."""
+    if uses_fts():
+        return SearchPaginator(query, per_page)
+    words = WORD_RE.findall(query)
+    querysets = []
+    for model in FTS_TABLES:
+        posts = model.objects.for_feed()
+        for word in words:
+            posts = posts.filter(text__icontains=word)
+        querysets += sharding.each_shard(posts if words else posts.none())
+    return CursorPaginator(MergedQuerySet(querysets), per_page)
@@ -0,0 +1,332 @@
+"""Шардирование постов и комментариев по автору.
+
+Базы-шарды перечислены в ``settings.POST_SHARDS``; если список пуст,
+всё лежит в ``default``, как раньше. Шард автора выбирается
+rendezvous-хешированием (``shard_for``): при добавлении шарда на новое
+место переезжают только посты, которым он теперь ближе всех, —
+примерно ``1/N``. Переносит их команда ``rebalance_shards``.
+
+Комментарии лежат на шарде поста, архив (``posts.archive``) — на шарде
+автора, как и горячие посты. Номера постов и комментариев выдают таблицы
+``PostLocation`` и ``CommentId`` в основной базе: они уникальны на всех
+шардах, а по ``PostLocation`` номер поста приводит к его
+автору и шарду. Пользователи, группы, подписки и остальные таблицы
+остаются в ``default``, поэтому на шардах посты не соединяются с
+авторами и группами, а догружаются отдельным запросом в основную базу
+(``PostQuerySet.for_feed``).
+
+Профиль и страница поста читают один шард. Общая лента, группы, лента
+подписок и поиск опрашивают шарды по очереди и сливают результаты по
+ключу сортировки (``MergedQuerySet``).
+"""
+import hashlib
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+from django.core.signals import setting_changed
+from django.db.models import IntegerField, Value
+from django.dispatch import receiver
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from .models import (
+    ArchivedComment, ArchivedPost, Comment, CommentId, Post, PostLocation
+)
+
+# Горячие и архивные посты вместе с их комментариями.
+POST_TABLES = ((Post, Comment), (ArchivedPost, ArchivedComment))
+SHARDED_MODELS = tuple(model for table in POST_TABLES for model in table)
+
+_seeded = False
+
+
+def enabled():
+    return bool(settings.POST_SHARDS)
+
+
+def aliases():
+    return list(settings.POST_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def shard_for(author_id, shards=None):
+    """Шард постов автора: у кого из шардов больше хеш пары с автором."""
+    shards = shards or aliases()
+    return max(shards, key=lambda alias: hashlib.md5(
+        f"{alias}:{author_id}".encode()
+    ).digest())
+
+
+def shards_for(author_ids):
+    return {shard_for(author_id) for author_id in author_ids}
+
+
+def allocate_post_id(author_id):
+    _seed_ids()
+    return PostLocation.objects.using(DEFAULT_DB_ALIAS).create(
+        author_id=author_id
+    ).pk
+
+
+def allocate_comment_id():
+    _seed_ids()
+    return CommentId.objects.using(DEFAULT_DB_ALIAS).create().pk
+
+
+def _seed_ids():
+    """Сдвигает счётчики ``PostLocation`` и ``CommentId`` за старые номера.
+
+    Посты и комментарии, созданные до шардирования, лежат в ``default``
+    с номерами своих таблиц, а ``rebalance_shards`` мог ещё не
+    запускаться. Достаточно записать самый большой номер: следующий
+    номер SQLite выдаст после него. Проверка делается раз на процесс.
+    """
+    global _seeded
+    if _seeded:
+        return
+    for model in (Post, ArchivedPost):
+        last = model.objects.using(DEFAULT_DB_ALIAS).order_by("-pk").values(
+            "pk", "author_id"
+        ).first()
+        if last is not None:
+            PostLocation.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+                [PostLocation(**last)], ignore_conflicts=True
+            )
+    for model in (Comment, ArchivedComment):
+        last_id = model.objects.using(DEFAULT_DB_ALIAS).order_by(
+            "-pk"
+        ).values_list("pk", flat=True).first()
+        if last_id is not None:
+            CommentId.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+                [CommentId(pk=last_id)], ignore_conflicts=True
+            )
+    _seeded = True
+
+
+@receiver(setting_changed)
+def _forget_seeding(setting, **kwargs):
+    global _seeded
+    if setting == "POST_SHARDS":
+        _seeded = False
+
+
+def locate(post_id):
+    """Шард поста ``post_id``; без шардирования — ``default``."""
+    if not enabled():
+        return DEFAULT_DB_ALIAS
+    author_id = PostLocation.objects.using(DEFAULT_DB_ALIAS).filter(
+        pk=post_id
+    ).values_list("author_id", flat=True).first()
+    if author_id is None:
+        return DEFAULT_DB_ALIAS
+    return shard_for(author_id)
+
+
+def for_author(queryset, author_id):
+    """``queryset`` постов на шарде автора ``author_id``."""
+    if not enabled():
+        return queryset
+    return queryset.using(shard_for(author_id))
+
+
+def for_post(queryset, post_id):
+    """``queryset`` постов или комментариев на шарде поста ``post_id``."""
+    if not enabled():
+        return queryset
+    return queryset.using(locate(post_id))
+
+
+def get_post_or_404(queryset, post_id):
+    """Пост с шарда его автора.
+
+    Пока ``rebalance_shards`` не закончил перенос, пост может лежать
+    на прежнем шарде: тогда он ищется на остальных.
+    """
+    if not enabled():
+        return get_object_or_404(queryset, pk=post_id)
+    shard = locate(post_id)
+    for alias in [shard] + [a for a in aliases() if a != shard]:
+        post = queryset.using(alias).filter(pk=post_id).first()
+        if post is not None:
+            return post
+    raise Http404("Пост не найден")
+
+
+def each_shard(queryset):
+    """Копии ``queryset`` для каждого шарда."""
+    return [queryset.using(alias) for alias in aliases()]
+
+
+def across_shards(queryset, shards=None):
+    """``queryset``, который при шардировании читает все шарды."""
+    if not enabled():
+        return queryset
+    shards = sorted(shards) if shards is not None else aliases()
+    return MergedQuerySet([queryset.using(alias) for alias in shards])
+
+
+class MergedQuerySet:
+    """Несколько выборок одной модели, слитые по ключу сортировки.
+
+    Так читаются шарды, а профиль — ещё и архив (``posts.archive``).
+    Поддерживает то, что нужно пагинаторам: ``filter``, ``order_by``,
+    срезы и ``count()``. Срез ``[:b]`` берёт первые ``b`` строк из
+    каждой выборки и сливает их кучей. Срез со смещением ``[a:b]`` по
+    выборкам одной базы — как горячие и архивные посты профиля — база
+    считает сама: ``UNION ALL`` ключей сортировки с ``LIMIT``/``OFFSET``,
+    а целиком загружаются только строки страницы. Выборки разных баз так
+    не слить, поэтому ``utils.paginate`` листает их только по курсору.
+    """
+
+    ordered = True
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+        self.model = self.querysets[0].model
+
+    def _apply(self, method, *args, **kwargs):
+        return MergedQuerySet([
+            getattr(queryset, method)(*args, **kwargs)
+            for queryset in self.querysets
+        ])
+
+    def filter(self, *args, **kwargs):
+        return self._apply("filter", *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._apply("exclude", *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._apply("order_by", *fields)
+
+    def none(self):
+        return self._apply("none")
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:None])
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop = item.start or 0, item.stop
+        if start and stop is not None and self.same_database:
+            return self._slice_in_sql(start, stop)
+        streams = [list(queryset[:stop]) for queryset in self.querysets]
+        keys, reverse = self._sort_key()
+        merged = heapq.merge(*streams, key=keys, reverse=reverse)
+        return list(islice(_unique(merged), start, stop))
+
+    @property
+    def same_database(self):
+        return len({queryset.db for queryset in self.querysets}) == 1
+
+    def _slice_in_sql(self, start, stop):
+        ordering = self._ordering()
+        names = [name.lstrip("-") for name in ordering]
+        columns = ["pk"] + [name for name in names if name != "pk"]
+        keys = [
+            queryset.order_by().prefetch_related(None)
+            .annotate(merged_source=Value(index, IntegerField()))
+            .values_list(*columns, "merged_source")
+            for index, queryset in enumerate(self.querysets)
+        ]
+        rows = list(
+            keys[0].union(*keys[1:], all=True).order_by(*ordering)[start:stop]
+        )
+        wanted = {}
+        for row in rows:
+            wanted.setdefault(row[-1], []).append(row[0])
+        loaded = {
+            (index, obj.pk): obj
+            for index, pks in wanted.items()
+            for obj in self.querysets[index].filter(pk__in=pks)
+        }
+        return [loaded[row[-1], row[0]] for row in rows
+                if (row[-1], row[0]) in loaded]
+
+    def _ordering(self):
+        query = self.querysets[0].query
+        return list(
+            query.order_by or (
+                self.model._meta.ordering if query.default_ordering else []
+            )
+        ) or ["pk"]
+
+    def _sort_key(self):
+        ordering = self._ordering()
+        descending = {name.startswith("-") for name in ordering}
+        if len(descending) > 1:
+            raise ValueError(
+                "Слияние выборок поддерживает только сортировку "
+                "в одном направлении"
+            )
+        names = [name.lstrip("-") for name in ordering]
+
+        def key(obj):
+            return tuple(getattr(obj, name) for name in names)
+        return key, descending.pop()
+
+
+def _unique(objects):
+    # Пока пост переносится, он есть в двух выборках.
+    seen = set()
+    for obj in objects:
+        if obj.pk not in seen:
+            seen.add(obj.pk)
+            yield obj
+
+
+class ShardRouter:
+    """Отправляет посты и комментарии на шард автора поста."""
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints, router.db_for_read)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints, router.db_for_write)
+
+    def _route(self, model, hints, route):
+        if not enabled():
+            return None
+        instance = hints.get("instance")
+        if model not in SHARDED_MODELS:
+            # Автор или группа поста с шарда читаются из основной базы
+            # (или её реплики).
+            if _on_shard(instance):
+                return route(model)
+            return None
+        if not isinstance(instance, SHARDED_MODELS):
+            return None
+        if not instance._state.adding and instance._state.db:
+            # Комментарии поста — на его шарде.
+            return instance._state.db
+        if isinstance(instance, Post):
+            return shard_for(instance.author_id)
+        if not isinstance(instance, Comment):
+            # Архивные строки пишет только archive_posts, с явной базой.
+            return None
+        if Comment.post.is_cached(instance):
+            return instance.post._state.db
+        return locate(instance.post_id)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if enabled():
+            databases = {DEFAULT_DB_ALIAS, *aliases()}
+            if obj1._state.db in databases and obj2._state.db in databases:
+                return True
+        return None
+
+
+def _on_shard(instance):
+    return (
+        instance is not None
+        and instance._state.db not in (None, DEFAULT_DB_ALIAS)
+        and instance._state.db in aliases()
+    )
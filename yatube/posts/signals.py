@@ -0,0 +1,159 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import caching, counters, feeds, media, sharding, thumbnails
+from .models import (
+    ArchivedComment, ArchivedPost, Comment, Follow, Group, Post
+)
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=Post)
+def allocate_post_id(sender, instance, raw=False, **kwargs):
+    """На шардах номер новому посту выдаёт основная база."""
+    if sharding.enabled() and instance.pk is None and not raw:
+        instance.pk = sharding.allocate_post_id(instance.author_id)
+
+
+@receiver(pre_save, sender=Comment)
+def allocate_comment_id(sender, instance, raw=False, **kwargs):
+    if sharding.enabled() and instance.pk is None and not raw:
+        instance.pk = sharding.allocate_comment_id()
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_rows(sender, instance, using, **kwargs):
+    """Каскад в основной базе не достаёт до постов на других шардах."""
+    if not sharding.enabled():
+        return
+    for alias in sharding.aliases():
+        if alias != using:
+            for model in (Post, Comment, ArchivedPost, ArchivedComment):
+                model.objects.using(alias).filter(author=instance).delete()
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    """Новый пост попадает в ленты подписчиков автора."""
+    if not created or raw:
+        return
+    if feeds.uses("inbox"):
+        feeds.fan_out(instance)
+    elif feeds.uses("pull"):
+        feeds.forget_recent(instance.author_id)
+
+
+@receiver(post_delete, sender=Post)
+def forget_post(sender, instance, **kwargs):
+    if feeds.uses("pull"):
+        feeds.forget_recent(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, raw=False, **kwargs):
+    """После подписки в ленту добавляются последние посты автора."""
+    if created and not raw and feeds.uses("inbox"):
+        feeds.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_feed(sender, instance, **kwargs):
+    """После отписки посты автора убираются из ленты."""
+    if feeds.uses("inbox"):
+        feeds.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    """Сбрасывает кэш лент, в которые входит пост."""
+    groups = {instance.group_id, getattr(instance, "_loaded_group_id", None)}
+    caching.bump_post(instance.pk, instance.author_id, *groups)
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_page(sender, instance, **kwargs):
+    caching.bump(caching.group_scope(instance.pk))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post_page(sender, instance, **kwargs):
+    caching.bump(caching.post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feed(sender, instance, **kwargs):
+    caching.bump(
+        caching.follow_scope(instance.user_id),
+        caching.stats_scope(instance.user_id),
+        caching.stats_scope(instance.author_id),
+    )
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.add(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.add(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.add_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.add_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.add(instance.user_id, following_count=1)
+        counters.add(instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.add(instance.user_id, following_count=-1)
+    counters.add(instance.author_id, followers_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def queue_thumbnails(sender, instance, raw=False, **kwargs):
+    """Миниатюры новой картинки делаются в фоне сразу после загрузки."""
+    name = instance.image.name
+    if name and not raw and name != getattr(instance, "_loaded_image", None):
+        thumbnails.queue(name)
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, raw=False, **kwargs):
+    """Одинаковые картинки хранятся одним файлом, считаем ссылки на него."""
+    name = instance.image.name or ""
+    loaded = getattr(instance, "_loaded_image", None) or ""
+    if raw or name == loaded:
+        return
+    if name:
+        media.retain(name)
+    if loaded:
+        media.release(loaded)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=ArchivedPost)
+def release_image(sender, instance, **kwargs):
+    if instance.image.name:
+        media.release(instance.image.name)
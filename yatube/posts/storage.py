@@ -0,0 +1,88 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, которое называет файлы по SHA-256 содержимого.
+
+    Файл ``posts/photo.jpg`` сохраняется как ``posts/ab/ab12….jpg``.
+    Одинаковые загрузки получают одно имя и хранятся один раз, а
+    миниатюры sorl, которые строятся по имени исходника, тоже общие.
+    Сколько постов ссылается на файл, считает ``posts.media``.
+
+    Файл сохраняется под блокировкой записи в базу: так сохранение не
+    пересечётся с отложенным удалением того же файла в
+    ``posts.media.delete_unused``.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым, суффиксы для уникальности не нужны.
+        return name
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        with transaction.atomic():
+            if not self.exists(name):
+                self._write(name, content)
+            # Свежая дата изменения не даст сборщику мусора и отложенному
+            # удалению стереть файл, на который вот-вот сошлётся новый
+            # пост. Она ставится явно: ядро берёт её с грубых часов, и
+            # она может оказаться раньше только что прочитанного
+            # time.time().
+            now = time.time_ns()
+            os.utime(self.path(name), ns=(now, now))
+        return name
+
+    def _write(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        self._make_directory(directory)
+        # Пишем во временный файл и переименовываем: одновременная
+        # загрузка тех же байтов просто заменит файл таким же.
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            # mkstemp создаёт файл с правами 0600, веб-сервер его не отдаст.
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _make_directory(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        old_umask = os.umask(0)
+        try:
+            os.makedirs(
+                directory, self.directory_permissions_mode, exist_ok=True
+            )
+        finally:
+            os.umask(old_umask)
+
+    @staticmethod
+    def content_name(name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        hexdigest = digest.hexdigest()
+        return os.path.join(
+            directory, hexdigest[:2], f"{hexdigest}{extension}"
+        )
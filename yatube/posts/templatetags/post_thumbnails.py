@@ -0,0 +1,17 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, size):
+    """Готовая миниатюра картинки поста; пока её нет — ``None``.
+
+    Миниатюры, найденные ``thumbnails.prefetch``, повторно не ищутся.
+    """
+    prefetched = getattr(post, "thumbnails", {})
+    if size in prefetched:
+        return prefetched[size]
+    return thumbnails.lookup(post.image, size)
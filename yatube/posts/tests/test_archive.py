@@ -0,0 +1,156 @@
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Model
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import counters, search
+from ..models import (
+    ArchivedComment, ArchivedPost, AuthorStats, Comment, Group, Post
+)
+
+User = get_user_model()
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+        self.old = Post.objects.create(
+            text="старый пост", author=self.author, group=self.group
+        )
+        Comment.objects.create(
+            post=self.old, author=self.author, text="старый комментарий"
+        )
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=timezone.now() - timedelta(days=400)
+        )
+        self.new = Post.objects.create(
+            text="новый пост", author=self.author, group=self.group
+        )
+        self.client.force_login(self.author)
+        # Счётчики считаются до архивации и не должны от неё меняться.
+        counters.stats_for(self.author.pk)
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command("archive_posts", "--older-than-days", "365", *args,
+                     stdout=out)
+        return out.getvalue()
+
+    def test_old_posts_move_to_archive(self):
+        pub_date = Post.objects.get(pk=self.old.pk).pub_date
+        output = self.archive()
+        self.assertIn("постов 1, комментариев 1", output)
+        self.assertIn("posts_post — строк 2 → 1", output)
+        self.assertEqual(list(Post.objects.all()), [self.new])
+        self.assertFalse(Comment.objects.exists())
+        archived = ArchivedPost.objects.get()
+        self.assertEqual(
+            (archived.pk, archived.pub_date, archived.comments_count),
+            (self.old.pk, pub_date, 1),
+        )
+        self.assertEqual(ArchivedComment.objects.get().post, archived)
+        self.assertIn("к архивации постов 0", self.archive("--dry-run"))
+
+    def test_dry_run_keeps_posts(self):
+        self.assertIn("к архивации постов 1", self.archive("--dry-run"))
+        self.assertEqual(Post.objects.count(), 2)
+
+    def test_feeds_skip_archive(self):
+        self.archive()
+        for url in (reverse("posts:index"),
+                    reverse("posts:group_list", args=["group"])):
+            response = Client().get(url)
+            self.assertContains(response, "новый пост")
+            self.assertNotContains(response, "старый пост")
+
+    def test_profile_and_detail_read_archive(self):
+        self.archive()
+        response = self.client.get(
+            reverse("posts:profile", args=["author"])
+        )
+        self.assertEqual(
+            [post.text for post in response.context["page_obj"]],
+            ["новый пост", "старый пост"],
+        )
+        self.assertEqual(response.context["posts_count"], 2)
+        response = self.client.get(
+            reverse("posts:post_detail", args=[self.old.pk])
+        )
+        self.assertContains(response, "старый комментарий")
+        self.assertNotContains(
+            response, reverse("posts:add_comment", args=[self.old.pk])
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse("posts:post_edit", args=[self.old.pk])
+            ).status_code,
+            404,
+        )
+
+    @skipUnless(connection.vendor == "sqlite",
+                "Индекс FTS5 есть только в SQLite")
+    def test_search_finds_archived_posts(self):
+        self.archive()
+        response = Client().get(reverse("posts:search"), {"q": "пост"})
+        self.assertCountEqual(
+            [post.text for post in response.context["page_obj"]],
+            ["новый пост", "старый пост"],
+        )
+        with mock.patch.object(search, "uses_fts", return_value=False):
+            response = Client().get(reverse("posts:search"), {"q": "стар"})
+        self.assertEqual(
+            [post.text for post in response.context["page_obj"]],
+            ["старый пост"],
+        )
+
+    def test_reconcile_counts_archived_posts(self):
+        self.archive()
+        AuthorStats.objects.update(posts_count=0)
+        call_command("reconcile_counters", stdout=StringIO())
+        self.assertEqual(AuthorStats.objects.get().posts_count, 2)
+
+    def test_deep_profile_page_loads_one_page(self):
+        now = timezone.now()
+        for day in range(40):
+            post = Post.objects.create(text=f"пост {day}", author=self.author)
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=now - timedelta(days=day * 20)
+            )
+        self.archive()
+        self.assertEqual(ArchivedPost.objects.count(), 22)
+        expected = [
+            post.text for post in sorted(
+                [*Post.objects.all(), *ArchivedPost.objects.all()],
+                key=lambda post: (post.pub_date, post.pk), reverse=True,
+            )
+        ][30:40]
+        loaded = Counter()
+        from_db = Model.from_db.__func__
+
+        def counting_from_db(cls, *args):
+            loaded[cls] += 1
+            return from_db(cls, *args)
+
+        with mock.patch.object(
+            Model, "from_db", classmethod(counting_from_db)
+        ):
+            response = self.client.get(
+                reverse("posts:profile", args=["author"]), {"page": 4}
+            )
+        self.assertEqual(
+            [post.text for post in response.context["page_obj"]], expected
+        )
+        self.assertLessEqual(loaded[Post] + loaded[ArchivedPost], 10)
@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from .. import caching, checks
+from ..models import Post
+
+User = get_user_model()
+
+LOCMEM = {"default": {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+}}
+
+
+class VersionsTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+
+    def test_versions_change_again_after_commit(self):
+        scope = caching.posts_scope()
+        with transaction.atomic():
+            Post.objects.create(text="пост", author=self.author)
+            # Так страницу с прежними данными закэшировал бы другой
+            # процесс, пока транзакция не зафиксирована.
+            during = caching.get_versions(scope)
+        self.assertNotEqual(caching.get_versions(scope), during)
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    @override_settings(CACHES=LOCMEM, DEBUG=False)
+    def test_process_local_cache_is_an_error(self):
+        errors = checks.check_shared_cache(None)
+        self.assertEqual([error.id for error in errors], ["posts.E001"])
+
+    @override_settings(CACHES=LOCMEM, DEBUG=True)
+    def test_process_local_cache_is_fine_for_debug(self):
+        self.assertEqual(checks.check_shared_cache(None), [])
+
+    def test_default_cache_is_shared(self):
+        self.assertEqual(checks.check_shared_cache(None), [])
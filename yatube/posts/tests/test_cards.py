@@ -0,0 +1,98 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template import engines
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from .. import cards
+from ..models import Group, Post
+
+User = get_user_model()
+
+
+class CardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.group = Group.objects.create(title="Группа", slug="group")
+        cls.posts = [
+            Post.objects.create(
+                text=f"text {index}", author=cls.author, group=cls.group
+            )
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def render(self, **flags):
+        posts = Post.objects.for_feed()
+        with mock.patch.object(
+            cards, "render_posts", wraps=cards.render_posts
+        ) as render, mock.patch.object(
+            cards.cache, "get_many", wraps=cards.cache.get_many
+        ) as get_many:
+            html = cards.render_cards(posts, **flags)
+        self.assertEqual(get_many.call_count, 1)
+        return html, sum(len(call.args[0]) for call in render.call_args_list)
+
+    def test_cards_are_rendered_once(self):
+        html, rendered = self.render()
+        self.assertEqual(rendered, 3)
+        cached_html, rendered = self.render()
+        self.assertEqual(rendered, 0)
+        self.assertEqual(cached_html, html)
+
+    def test_flags_are_part_of_key(self):
+        self.render()
+        html, rendered = self.render(profile_page=True)
+        self.assertEqual(rendered, 3)
+        self.assertNotIn("Все посты автора", html[0])
+
+    def test_edit_invalidates_only_edited_card(self):
+        self.render()
+        post = self.posts[0]
+        self.author_client.post(
+            reverse("posts:post_edit", args=[post.pk]),
+            {"text": "исправленный текст", "group": self.group.pk},
+        )
+        html, rendered = self.render()
+        self.assertEqual(rendered, 1)
+        self.assertTrue(any("исправленный текст" in card for card in html))
+
+    def test_author_and_group_changes_invalidate_cards(self):
+        self.render()
+        self.author.first_name = "Лев"
+        self.author.last_name = "Толстой"
+        self.author.save()
+        html, rendered = self.render()
+        self.assertEqual(rendered, 3)
+        self.assertIn("Лев Толстой", html[0])
+        Group.objects.filter(pk=self.group.pk).update(slug="renamed")
+        html, rendered = self.render()
+        self.assertEqual(rendered, 3)
+        self.assertIn("/group/renamed/", html[0])
+
+    def test_feed_page_uses_cards(self):
+        self.render()
+        with mock.patch.object(cards, "render_posts") as render:
+            response = self.client.get(reverse("posts:index"))
+        render.assert_not_called()
+        self.assertContains(response, "text 1")
+
+    def test_template_is_compiled_once_per_list(self):
+        posts = list(Post.objects.for_feed())
+        engine = engines["django"].engine
+        with mock.patch.object(
+            engine, "get_template", wraps=engine.get_template
+        ) as get_template:
+            html = cards.render_posts(posts, group_page=True)
+        get_template.assert_called_once_with(cards.CARD_TEMPLATE)
+        self.assertEqual(len(html), 3)
+        self.assertNotIn("все записи группы", html[0])
+        self.assertIn("text", html[0])
@@ -0,0 +1,109 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from .. import counters
+from ..counters import stats_for
+from ..models import AuthorStats, Comment, Post
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="counted-author")
+        cls.reader = User.objects.create_user(username="counted-reader")
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        # Строки счётчиков создаются заранее, чтобы проверять их изменение.
+        stats_for(self.author.pk)
+        stats_for(self.reader.pk)
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_posts_count_follows_create_and_delete(self):
+        self.author_client.post(reverse("posts:post_create"), {"text": "a"})
+        self.author_client.post(reverse("posts:post_create"), {"text": "b"})
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        Post.objects.filter(author=self.author).first().delete()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+
+    def test_post_created_while_counting_is_counted_once(self):
+        author = User.objects.create_user(username="fresh-author")
+        live_counters = counters.live_counters
+
+        def count_with_new_post():
+            # Сигнал нового поста прибавляет к уже созданной строке.
+            Post.objects.create(text="во время подсчёта", author=author)
+            return live_counters()
+
+        with mock.patch.object(counters, "live_counters",
+                               count_with_new_post):
+            self.assertEqual(stats_for(author.pk).posts_count, 1)
+        Post.objects.create(text="после подсчёта", author=author)
+        self.assertEqual(self.stats(author).posts_count, 2)
+
+    def test_follow_counters(self):
+        self.reader_client.get(
+            reverse("posts:profile_follow", args=[self.author.username])
+        )
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.reader_client.get(
+            reverse("posts:profile_unfollow", args=[self.author.username])
+        )
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_comments_count_survives_post_edit(self):
+        post = Post.objects.create(text="text", author=self.author)
+        stale = Post.objects.get(pk=post.pk)
+        self.reader_client.post(
+            reverse("posts:add_comment", args=[post.pk]), {"text": "c"}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        stale.text = "edited"
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        Comment.objects.get(post=post).delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_pages_show_counters(self):
+        post = Post.objects.create(text="text", author=self.author)
+        response = self.client.get(
+            reverse("posts:post_detail", args=[post.pk])
+        )
+        self.assertEqual(response.context["author_stats"].posts_count, 1)
+        response = self.client.get(
+            reverse("posts:profile", args=[self.author.username])
+        )
+        self.assertEqual(response.context["posts_count"], 1)
+
+    def test_reconcile_repairs_drift(self):
+        post = Post.objects.create(text="text", author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text="c")
+        AuthorStats.objects.filter(user=self.author).update(
+            posts_count=10, followers_count=3
+        )
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        out = StringIO()
+        call_command("reconcile_counters", stdout=out)
+        self.assertIn("Исправлено счётчиков: 2", out.getvalue())
+        stats = self.stats(self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count), (1, 0))
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
@@ -0,0 +1,151 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..feeds import RECENT_POSTS_KEY
+from ..models import FeedItem, Follow, PopularAuthor, Post
+
+User = get_user_model()
+
+
+class FollowFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="feed-author")
+        cls.reader = User.objects.create_user(username="feed-reader")
+        cls.other = User.objects.create_user(username="feed-other")
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def feed(self, **params):
+        response = self.reader_client.get(
+            reverse("posts:follow_index"), params
+        )
+        return list(response.context["page_obj"])
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        """Новый пост раскладывается только в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text="fan-out", author=self.author)
+        self.assertTrue(
+            FeedItem.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertFalse(FeedItem.objects.filter(user=self.other).exists())
+        self.assertEqual(self.feed(), [post])
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка добавляет старые посты автора, отписка — убирает."""
+        posts = [
+            Post.objects.create(text=f"old {index}", author=self.author)
+            for index in range(3)
+        ]
+        self.reader_client.get(
+            reverse("posts:profile_follow", args=[self.author.username])
+        )
+        self.assertEqual(self.feed(), posts[::-1])
+        self.reader_client.get(
+            reverse("posts:profile_unfollow", args=[self.author.username])
+        )
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_popular_author_is_pulled_at_read_time(self):
+        """Посты автора сверх лимита рассылки подмешиваются при чтении."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.other, author=self.author)
+        own = Post.objects.create(text="inbox", author=self.other)
+        Follow.objects.create(user=self.reader, author=self.other)
+        popular = Post.objects.create(text="popular", author=self.author)
+        self.assertTrue(
+            PopularAuthor.objects.filter(author=self.author).exists()
+        )
+        self.assertFalse(FeedItem.objects.filter(post=popular).exists())
+        self.assertEqual(self.feed(), [popular, own])
+
+    def test_feed_pages_by_cursor(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.bulk_create([
+            Post(text=f"bulk {index}", author=self.author)
+            for index in range(12)
+        ])
+        call_command("rebuild_feeds", self.reader.username, stdout=StringIO())
+        response = self.reader_client.get(reverse("posts:follow_index"))
+        page_obj = response.context["page_obj"]
+        rest = self.feed(cursor=page_obj.next_cursor)
+        self.assertEqual(len(page_obj) + len(rest), 12)
+        self.assertFalse(set(page_obj) & set(rest))
+
+    def test_rebuild_command_restores_feed(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text="rebuild", author=self.author)
+        FeedItem.objects.all().delete()
+        call_command("rebuild_feeds", stdout=StringIO())
+        self.assertEqual(self.feed(), [post])
+
+
+@override_settings(FOLLOW_FEED_BACKEND="pull", FEED_RECENT_POSTS=5)
+class PullFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username="pull-reader")
+        cls.authors = [
+            User.objects.create_user(username=f"pull-author-{index}")
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        for author in self.authors:
+            Follow.objects.create(user=self.reader, author=author)
+
+    def read_all(self):
+        """Проходит ленту по курсорам до конца."""
+        posts, cursor = [], None
+        while True:
+            params = {"cursor": cursor} if cursor else {}
+            page_obj = self.reader_client.get(
+                reverse("posts:follow_index"), params
+            ).context["page_obj"]
+            posts.extend(page_obj)
+            cursor = page_obj.next_cursor
+            if cursor is None:
+                return posts
+
+    def test_merged_feed_matches_join(self):
+        """Слияние списков совпадает с соединением и за горизонтом."""
+        for index in range(24):
+            Post.objects.create(
+                text=f"pull {index}", author=self.authors[index % 3]
+            )
+        Post.objects.create(
+            text="stranger", author=User.objects.create(username="x")
+        )
+        expected = list(
+            Post.objects.filter(author__in=self.authors)
+            .order_by("-pub_date", "-pk")
+        )
+        self.assertEqual(self.read_all(), expected)
+        with override_settings(FOLLOW_FEED_BACKEND="join"):
+            self.assertEqual(self.read_all(), expected)
+
+    def test_new_post_refreshes_cached_list(self):
+        author = self.authors[0]
+        Post.objects.create(text="first", author=author)
+        self.read_all()
+        post = Post.objects.create(text="second", author=author)
+        self.assertIsNone(cache.get(RECENT_POSTS_KEY.format(author.pk)))
+        self.assertEqual(self.read_all()[0], post)
+        entries = cache.get(RECENT_POSTS_KEY.format(author.pk))
+        self.assertEqual(entries[0], (post.pub_date, post.pk))
+        self.assertFalse(FeedItem.objects.exists())
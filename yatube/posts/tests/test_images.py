@@ -0,0 +1,86 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+ORIENTATION_TAG = 0x0112
+
+
+def image_file(name, size, mode="RGB", fmt="JPEG", orientation=None):
+    image = Image.new(mode, size, color="red")
+    buffer = BytesIO()
+    params = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = orientation
+        params["exif"] = exif.tobytes()
+    image.save(buffer, fmt, **params)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_MAX_SIZE=100)
+class ImageNormalizationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def upload(self, image):
+        self.author_client.post(
+            reverse("posts:post_create"), {"text": "text", "image": image}
+        )
+        post = Post.objects.latest("pk")
+        return post, Image.open(post.image.path)
+
+    def test_large_photo_is_rotated_downscaled_and_stripped(self):
+        post, stored = self.upload(
+            image_file("photo.jpeg", (400, 200), orientation=6)
+        )
+        self.assertEqual(stored.format, "JPEG")
+        # Ориентация 6 — поворот на 90°, поэтому высота больше ширины.
+        self.assertEqual(stored.size, (50, 100))
+        self.assertFalse(stored.getexif())
+        self.assertTrue(post.image.name.endswith(".jpg"))
+        self.assertGreater(post.image_original_bytes, 0)
+        self.assertEqual(post.image_bytes, post.image.size)
+
+    def test_transparent_image_stays_png(self):
+        _, stored = self.upload(
+            image_file("logo.png", (300, 300), mode="RGBA", fmt="PNG")
+        )
+        self.assertEqual(stored.format, "PNG")
+        self.assertEqual(stored.size, (100, 100))
+
+    def test_small_clean_image_is_kept(self):
+        upload = image_file("small.png", (20, 10), fmt="PNG")
+        post, stored = self.upload(upload)
+        upload.seek(0)
+        with post.image.open("rb") as file:
+            self.assertEqual(file.read(), upload.read())
+        self.assertEqual(post.image_original_bytes, post.image_bytes)
+
+    def test_other_formats_are_reencoded(self):
+        post, stored = self.upload(image_file("scan.bmp", (20, 10), fmt="BMP"))
+        self.assertEqual(stored.format, "JPEG")
+        self.assertLess(post.image_bytes, post.image_original_bytes)
@@ -0,0 +1,106 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == "sqlite", "Планы запросов SQLite")
+class QueryPlanTests(TestCase):
+    """Запросы страниц идут по индексам, без сортировки во временном дереве."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(
+            title="title", slug="slug", description="description"
+        )
+        cls.post = Post.objects.create(
+            text="text", author=cls.author, group=cls.group
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader, text="c")
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def plans(self, address):
+        with CaptureQueriesContext(connection) as queries:
+            self.reader_client.get(address)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query["sql"].startswith("SELECT"):
+                    continue
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                plans.append(
+                    "\n".join(str(row[-1]) for row in cursor.fetchall())
+                )
+        return plans
+
+    def assertUsesIndex(self, address, index, ordered=True):
+        plans = [plan for plan in self.plans(address) if index in plan]
+        self.assertTrue(plans, f"{address} не использует {index}")
+        for plan in plans:
+            if ordered:
+                self.assertNotIn("TEMP B-TREE FOR ORDER BY", plan)
+            self.assertNotIn("TEMP B-TREE FOR DISTINCT", plan)
+
+    def test_feeds_use_their_indexes(self):
+        addresses = {
+            reverse("posts:index"): "post_pub_date_idx",
+            reverse("posts:group_list", args=[self.group.slug]):
+                "post_group_pub_date_idx",
+            reverse("posts:profile", args=[self.author.username]):
+                "post_author_pub_date_idx",
+            reverse("posts:post_detail", args=[self.post.pk]):
+                "comment_post_created_idx",
+            reverse("posts:follow_index"): "feed_item_user_pub_date_idx",
+        }
+        for address, index in addresses.items():
+            with self.subTest(address=address):
+                self.assertUsesIndex(address, index)
+
+    @override_settings(FOLLOW_FEED_BACKEND="join")
+    def test_join_follow_feed_uses_author_index(self):
+        """Посты нескольких авторов сливаются сортировкой, но без DISTINCT."""
+        self.assertUsesIndex(
+            reverse("posts:follow_index"), "post_author_pub_date_idx",
+            ordered=False,
+        )
+
+
+class FollowConstraintTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+
+    def test_duplicate_follow_is_rejected(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_repeated_follow_keeps_one_row(self):
+        client = Client()
+        client.force_login(self.reader)
+        address = reverse("posts:profile_follow", args=[self.author.username])
+        client.get(address)
+        client.get(address)
+        self.assertEqual(
+            Follow.objects.filter(user=self.reader, author=self.author)
+            .count(),
+            1,
+        )
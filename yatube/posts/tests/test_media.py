@@ -0,0 +1,241 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+
+from .. import media, thumbnails
+from ..models import MediaFile, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+OTHER_GIF = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00')
+
+
+def on_commit(func):
+    # TestCase не фиксирует транзакцию, поэтому колбэк вызывается сразу.
+    func()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@mock.patch.object(media.transaction, "on_commit", on_commit)
+@mock.patch.object(thumbnails.transaction, "on_commit", on_commit)
+class MediaDeduplicationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def create_post(self, name, content=SMALL_GIF):
+        self.author_client.post(reverse("posts:post_create"), {
+            "text": "text",
+            "image": SimpleUploadedFile(name, content, "image/gif"),
+        })
+        return Post.objects.latest("pk")
+
+    def refs(self, name):
+        media_file = MediaFile.objects.filter(name=name).first()
+        return media_file.refs if media_file else 0
+
+    def test_identical_uploads_share_file_and_thumbnails(self):
+        first = self.create_post("first.gif")
+        second = self.create_post("Second.GIF")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith("posts/"))
+        self.assertTrue(first.image.name.endswith(".gif"))
+        self.assertEqual(self.refs(first.image.name), 2)
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+        geometry, options = thumbnails.GEOMETRIES["card"]
+        self.assertEqual(
+            thumbnails.thumbnail_file(first.image, geometry, options).name,
+            thumbnails.thumbnail_file(second.image, geometry, options).name,
+        )
+
+    def test_different_content_gets_different_name(self):
+        first = self.create_post("same.gif")
+        second = self.create_post("same.gif", OTHER_GIF)
+        self.assertNotEqual(first.image.name, second.image.name)
+
+    def test_file_is_removed_with_last_reference(self):
+        first = self.create_post("shared.gif", OTHER_GIF)
+        second = self.create_post("shared-copy.gif", OTHER_GIF)
+        name, path = first.image.name, first.image.path
+        self.assertIsNotNone(default.kvstore.get(thumbnails.source(name)))
+        first.delete()
+        self.assertEqual(self.refs(name), 1)
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(default.kvstore.get(thumbnails.source(name)))
+
+    def test_upload_during_pending_delete_keeps_file(self):
+        post = self.create_post("pending.gif", OTHER_GIF)
+        name, path = post.image.name, post.image.path
+        pending = []
+        with mock.patch.object(media.transaction, "on_commit",
+                               pending.append):
+            post.delete()
+        # Те же байты загрузили, пока удаление ждало фиксации.
+        again = self.create_post("again.gif", OTHER_GIF)
+        self.assertEqual(again.image.name, name)
+        for callback in pending:
+            callback()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.refs(name), 1)
+
+    def test_file_saved_before_its_post_survives_pending_delete(self):
+        post = self.create_post("unsaved.gif", OTHER_GIF)
+        name, path = post.image.name, post.image.path
+        pending = []
+        with mock.patch.object(media.transaction, "on_commit",
+                               pending.append):
+            post.delete()
+        # Файл уже сохранён, а пост со ссылкой на него — ещё нет.
+        storage = Post._meta.get_field("image").storage
+        self.assertEqual(
+            storage.save("posts/unsaved.gif", ContentFile(OTHER_GIF)), name
+        )
+        for callback in pending:
+            callback()
+        self.assertTrue(os.path.exists(path))
+
+    def test_replacing_image_moves_reference(self):
+        post = self.create_post("before.gif")
+        old_name = post.image.name
+        self.author_client.post(
+            reverse("posts:post_edit", args=[post.pk]),
+            {"text": "text",
+             "image": SimpleUploadedFile("after.gif", OTHER_GIF)},
+        )
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old_name)
+        self.assertEqual(self.refs(post.image.name), 1)
+        self.assertEqual(self.refs(old_name), 0)
+        # Сохранение без новой картинки счётчик не трогает.
+        post.text = "new text"
+        post.save()
+        self.assertEqual(self.refs(post.image.name), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GarbageCollectionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Ключи sorl в кэше переживают откат транзакции теста.
+        cache.clear()
+        self.storage = Post._meta.get_field("image").storage
+        self.post = Post.objects.create(
+            text="text", author=self.author,
+            image=SimpleUploadedFile("kept.gif", SMALL_GIF),
+        )
+        thumbnails.generate(self.post.image.name)
+        self.orphan = self.save_old("posts/orphan.gif", OTHER_GIF)
+        thumbnails.generate(self.orphan)
+        self.stray = self.save_old("cache/00/00/stray.jpg", SMALL_GIF,
+                                   storage=default.storage)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def save_old(self, name, content, storage=None):
+        storage = storage or self.storage
+        name = storage.save(name, ContentFile(content))
+        day_ago = time.time() - 24 * 60 * 60
+        os.utime(storage.path(name), (day_ago, day_ago))
+        return name
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command("gc_media", *args, stdout=out)
+        return out.getvalue()
+
+    def thumbnail_paths(self, name):
+        return [
+            default.storage.path(thumbnail.name)
+            for thumbnail in (
+                default.kvstore.get(thumbnails.thumbnail_file(
+                    name, geometry, options
+                ))
+                for size in thumbnails.GEOMETRIES
+                for _, _, geometry, options in thumbnails.variants(size)
+            )
+            if thumbnail
+        ]
+
+    def test_dry_run_removes_nothing(self):
+        output = self.gc("--dry-run")
+        self.assertIn("Картинки: просмотрено 2, к удалению 1", output)
+        self.assertIn("Миниатюры:", output)
+        self.assertTrue(self.storage.exists(self.orphan))
+        self.assertTrue(default.storage.exists(self.stray))
+
+    def test_orphans_are_removed_and_referenced_files_kept(self):
+        orphan_thumbnails = self.thumbnail_paths(self.orphan)
+        kept_thumbnails = self.thumbnail_paths(self.post.image.name)
+        self.assertTrue(orphan_thumbnails)
+        self.gc()
+        self.assertFalse(self.storage.exists(self.orphan))
+        self.assertFalse(default.storage.exists(self.stray))
+        self.assertFalse(any(map(os.path.exists, orphan_thumbnails)))
+        self.assertTrue(self.storage.exists(self.post.image.name))
+        self.assertTrue(all(map(os.path.exists, kept_thumbnails)))
+        self.assertIsNone(
+            default.kvstore.get(thumbnails.source(self.orphan))
+        )
+
+    def test_sources_without_files_are_forgotten(self):
+        self.storage.delete(self.orphan)
+        self.gc()
+        self.assertIsNone(
+            default.kvstore.get(thumbnails.source(self.orphan))
+        )
+        self.assertIsNotNone(
+            default.kvstore.get(thumbnails.source(self.post.image.name))
+        )
+
+    def test_recent_files_are_left_alone(self):
+        fresh = self.storage.save("posts/fresh.gif", ContentFile(b"fresh"))
+        self.gc("--batch-size", "1")
+        self.assertTrue(self.storage.exists(fresh))
+        self.assertFalse(self.storage.exists(self.orphan))
@@ -0,0 +1,93 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Post
+from ..search import match_expression
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == "sqlite", "Индекс FTS5 есть только в SQLite")
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pass"
+        )
+        texts = [
+            "Кошка спит на окне",
+            "Собака лает во дворе",
+            "Кошка, кошка и ещё раз кошка",
+            "Ёжик в тумане",
+        ]
+        cls.posts = [
+            Post.objects.create(text=text, author=cls.author)
+            for text in texts
+        ]
+
+    def search(self, query, **params):
+        response = self.client.get(reverse("posts:search"), {"q": query,
+                                                              **params})
+        return response, [post.text for post in response.context["page_obj"]]
+
+    def test_results_are_ranked(self):
+        _, texts = self.search("кошка")
+        self.assertEqual(
+            texts, ["Кошка, кошка и ещё раз кошка", "Кошка спит на окне"]
+        )
+
+    def test_prefix_and_diacritics(self):
+        _, texts = self.search("соба")
+        self.assertEqual(texts, ["Собака лает во дворе"])
+        _, texts = self.search("ёжик")
+        self.assertEqual(texts, ["Ёжик в тумане"])
+
+    def test_index_follows_updates_and_deletes(self):
+        post = Post.objects.get(pk=self.posts[1].pk)
+        post.text = "Кошка лает во дворе"
+        post.save()
+        _, texts = self.search("кошка")
+        self.assertIn("Кошка лает во дворе", texts)
+        post.delete()
+        _, texts = self.search("лает")
+        self.assertEqual(texts, [])
+
+    def test_cursor_pages_keep_query(self):
+        Post.objects.bulk_create(
+            Post(text=f"Погода {index}", author=self.author)
+            for index in range(15)
+        )
+        response, first = self.search("погода")
+        page_obj = response.context["page_obj"]
+        self.assertEqual(len(first), 10)
+        self.assertContains(
+            response, f"?q=%D0%BF%D0%BE%D0%B3%D0%BE%D0%B4%D0%B0&amp;"
+                      f"cursor={page_obj.next_cursor}"
+        )
+        response, second = self.search("погода", cursor=page_obj.next_cursor)
+        self.assertEqual(len(second), 5)
+        self.assertFalse(set(first) & set(second))
+        previous = response.context["page_obj"].previous_cursor
+        _, back = self.search("погода", cursor=previous)
+        self.assertEqual(back, first)
+
+    def test_query_syntax_is_not_passed_through(self):
+        self.assertEqual(match_expression('кошка OR "собака'),
+                         '"кошка"* "OR"* "собака"*')
+        response, texts = self.search('"(*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(texts, [])
+
+    def test_admin_search_uses_index(self):
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get(
+            reverse("admin:posts_post_changelist"), {"q": "кошка"}
+        )
+        self.assertEqual(response.context["cl"].result_count, 2)
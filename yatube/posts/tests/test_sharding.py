@@ -0,0 +1,239 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import counters, sharding
+from ..models import (
+    AuthorStats, Comment, CommentId, Follow, Post, PostLocation
+)
+
+User = get_user_model()
+
+SHARDS = ["default", "shard-1", "shard-2"]
+EXTRA_SHARDS = SHARDS[1:]
+
+
+@override_settings(POST_SHARDS=SHARDS)
+class ShardingTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        for alias in EXTRA_SHARDS:
+            connections.databases[alias] = {
+                "ENGINE": "core.backends.sqlite3",
+                "NAME": os.path.join(cls.directory, f"{alias}.sqlite3"),
+                "OPTIONS": {"pragmas": {"foreign_keys": "OFF"}},
+            }
+            call_command("migrate", database=alias, verbosity=0)
+            # migrate снова включает внешние ключи на своём соединении.
+            connections[alias].close()
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in EXTRA_SHARDS:
+            connections[alias].close()
+            del connections.databases[alias]
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        # По автору на каждый шард.
+        self.authors = {}
+        index = 0
+        while len(self.authors) < len(SHARDS):
+            user = User.objects.create_user(username=f"author{index}")
+            self.authors.setdefault(sharding.shard_for(user.pk), user)
+            index += 1
+        self.reader = User.objects.create_user(username="reader")
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def tearDown(self):
+        for alias in EXTRA_SHARDS:
+            Post.objects.using(alias).all().delete()
+
+    def create_posts(self, per_author):
+        return [
+            Post.objects.create(text=f"{author.username} {index}",
+                                author=author)
+            for index in range(per_author)
+            for author in self.authors.values()
+        ]
+
+    def test_posts_and_comments_live_on_author_shard(self):
+        for alias, author in self.authors.items():
+            client = Client()
+            client.force_login(author)
+            client.post(reverse("posts:post_create"), {"text": alias})
+            post = Post.objects.using(alias).get(text=alias)
+            self.reader_client.post(
+                reverse("posts:add_comment", args=[post.pk]),
+                {"text": f"к посту {alias}"},
+            )
+            post.refresh_from_db()
+            self.assertEqual(post.comments_count, 1)
+            self.assertEqual(
+                Comment.objects.using(alias).get().post_id, post.pk
+            )
+            for other in SHARDS:
+                if other != alias:
+                    self.assertFalse(
+                        Post.objects.using(other).filter(text=alias).exists()
+                    )
+        ids = [post.pk for alias in SHARDS
+               for post in Post.objects.using(alias).all()]
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def next_id(self, model):
+        with connections["default"].cursor() as cursor:
+            cursor.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = %s",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return (row[0] if row else 0) + 1
+
+    def test_new_ids_skip_posts_created_before_sharding(self):
+        # До шардирования номера выдавали сами таблицы, и rebalance_shards
+        # ещё не запускался.
+        post_id = self.next_id(PostLocation)
+        comment_id = self.next_id(CommentId)
+        with self.settings(POST_SHARDS=[]):
+            old = [
+                Post.objects.create(
+                    pk=post_id + index, text="старый", author=author
+                )
+                for index, author in enumerate(self.authors.values())
+            ]
+            Comment.objects.create(
+                pk=comment_id, post=old[0], author=self.reader, text="old"
+            )
+        new = self.create_posts(per_author=1)
+        comment = Comment.objects.create(
+            post=new[0], author=self.reader, text="new"
+        )
+        self.assertFalse({post.pk for post in old} & {
+            post.pk for post in new
+        })
+        self.assertNotEqual(comment.pk, comment_id)
+        for post in new:
+            self.assertEqual(
+                sharding.locate(post.pk), sharding.shard_for(post.author_id)
+            )
+
+    def test_index_merges_shards_by_pub_date(self):
+        posts = self.create_posts(per_author=4)
+        expected = [post.text for post in reversed(posts)]
+        response = self.client.get(reverse("posts:index"))
+        page = response.context["page_obj"]
+        self.assertEqual([post.text for post in page], expected[:10])
+        response = self.client.get(
+            reverse("posts:index"), {"cursor": page.next_cursor}
+        )
+        self.assertEqual(
+            [post.text for post in response.context["page_obj"]],
+            expected[10:],
+        )
+        response = self.client.get(reverse("posts:index"), {"page": 1})
+        self.assertEqual(response.context["page_obj"].paginator.count, 12)
+
+    def test_page_numbers_across_shards_fall_back_to_cursor(self):
+        posts = self.create_posts(per_author=4)
+        expected = [post.text for post in reversed(posts)]
+        response = self.client.get(reverse("posts:index"), {"page": 2})
+        page = response.context["page_obj"]
+        self.assertTrue(page.paginator.is_cursor)
+        self.assertEqual([post.text for post in page], expected[:10])
+        self.assertIsNotNone(page.next_cursor)
+
+    def test_profile_and_detail_read_only_owning_shard(self):
+        self.create_posts(per_author=1)
+        alias, author = next(
+            (alias, author) for alias, author in self.authors.items()
+            if alias != "default"
+        )
+        post = Post.objects.using(alias).get()
+        others = [connections[other] for other in EXTRA_SHARDS
+                  if other != alias]
+        queries = [CaptureQueriesContext(other) for other in others]
+        for context in queries:
+            context.__enter__()
+        try:
+            profile = self.client.get(
+                reverse("posts:profile", args=[author.username])
+            )
+            detail = self.client.get(
+                reverse("posts:post_detail", args=[post.pk])
+            )
+        finally:
+            for context in queries:
+                context.__exit__(None, None, None)
+        self.assertContains(profile, post.text)
+        self.assertContains(detail, post.text)
+        self.assertEqual(sum(len(context) for context in queries), 0)
+
+    def test_follow_index_merges_followed_authors(self):
+        self.create_posts(per_author=1)
+        followed = [author for alias, author in self.authors.items()
+                    if alias != "default"]
+        for author in followed:
+            Follow.objects.create(user=self.reader, author=author)
+        response = self.reader_client.get(reverse("posts:follow_index"))
+        self.assertEqual(
+            {post.author for post in response.context["page_obj"]},
+            set(followed),
+        )
+
+    def test_search_merges_shards(self):
+        self.create_posts(per_author=1)
+        response = self.client.get(reverse("posts:search"), {"q": "author"})
+        self.assertEqual(len(response.context["page_obj"]), len(SHARDS))
+
+    def test_rebalance_moves_posts_to_their_shards(self):
+        with self.settings(POST_SHARDS=[]):
+            posts = self.create_posts(per_author=2)
+            for post in posts:
+                Comment.objects.create(
+                    post=post, author=self.reader, text="комментарий"
+                )
+        out = StringIO()
+        call_command("rebalance_shards", "--dry-run", stdout=out)
+        self.assertIn("к переносу постов 2", out.getvalue())
+        self.assertEqual(Post.objects.using("default").count(), len(posts))
+        call_command("rebalance_shards", "--batch-size", "2",
+                     stdout=StringIO())
+        for alias, author in self.authors.items():
+            self.assertEqual(
+                Post.objects.using(alias).filter(author=author).count(), 2
+            )
+            self.assertEqual(Comment.objects.using(alias).count(), 2)
+        post = posts[-1]
+        response = self.client.get(
+            reverse("posts:post_detail", args=[post.pk])
+        )
+        self.assertContains(response, "комментарий")
+        out = StringIO()
+        call_command("rebalance_shards", stdout=out)
+        self.assertNotIn("перенесено", out.getvalue())
+
+    def test_counters_count_posts_on_shards(self):
+        self.create_posts(per_author=2)
+        for author in self.authors.values():
+            self.assertEqual(counters.stats_for(author.pk).posts_count, 2)
+        AuthorStats.objects.update(posts_count=0)
+        call_command("reconcile_counters", stdout=StringIO())
+        self.assertEqual(
+            set(AuthorStats.objects.values_list("posts_count", flat=True)),
+            {2},
+        )
@@ -0,0 +1,176 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default, get_thumbnail
+
+from .. import caching, thumbnails
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+OTHER_GIF = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\xFF\x00')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def create_post(self, name="small.gif", content=SMALL_GIF):
+        self.author_client.post(reverse("posts:post_create"), {
+            "text": "text",
+            "image": SimpleUploadedFile(
+                name=name, content=content, content_type="image/gif"
+            ),
+        })
+        return Post.objects.latest("pk")
+
+    def test_names_match_sorl(self):
+        post = Post.objects.create(
+            text="text", author=self.author,
+            image=SimpleUploadedFile("names.gif", SMALL_GIF),
+        )
+        for size in thumbnails.GEOMETRIES:
+            for fmt, width, geometry, options in thumbnails.variants(size):
+                with self.subTest(size=size, width=width):
+                    self.assertEqual(
+                        thumbnails.thumbnail_file(
+                            post.image, geometry, options
+                        ).name,
+                        get_thumbnail(post.image, geometry, **options).name,
+                    )
+
+    def test_modern_formats_get_their_extension(self):
+        name = thumbnails.thumbnail_file(
+            "posts/photo.jpg", "900x450", {"format": "AVIF"}
+        ).name
+        self.assertTrue(name.endswith(".avif"))
+
+    def test_upload_generates_every_variant(self):
+        # TestCase не фиксирует транзакцию, поэтому колбэк вызывается
+        # сразу; в тестах очередь миниатюр выполняет задачу на месте.
+        with mock.patch.object(
+            thumbnails.transaction, "on_commit", lambda func: func()
+        ):
+            post = self.create_post()
+        with mock.patch.object(thumbnails, "queue") as queue:
+            for size in thumbnails.GEOMETRIES:
+                with self.subTest(size=size):
+                    image = thumbnails.lookup(post.image, size)
+                    widths = [
+                        width for fmt, width, _, _
+                        in thumbnails.variants(size)
+                        if fmt == thumbnails.FALLBACK_FORMAT
+                    ]
+                    self.assertEqual(
+                        image.srcset.count("w,") + 1, len(widths)
+                    )
+        queue.assert_not_called()
+        response = self.client.get(reverse("posts:index"))
+        self.assertContains(response, "<picture>")
+        self.assertContains(response, 'sizes="(max-width: 900px)')
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_upload_queues_generation(self):
+        executor = mock.Mock()
+        with mock.patch.object(
+            thumbnails.transaction, "on_commit", lambda func: func()
+        ), mock.patch.object(thumbnails, "_executor", executor), \
+                mock.patch.object(default.engine, "get_image") as get_image:
+            post = self.create_post("queued.gif", OTHER_GIF)
+        get_image.assert_not_called()
+        executor.submit.assert_called_once_with(
+            thumbnails._run_in_background, post.image.name
+        )
+
+    def test_pages_do_not_block_on_missing_thumbnails(self):
+        post = self.create_post("pending.gif", OTHER_GIF)
+        with mock.patch.object(thumbnails, "queue") as queue, \
+                mock.patch.object(default.engine, "get_image") as get_image:
+            response = self.client.get(
+                reverse("posts:post_detail", args=[post.pk])
+            )
+        get_image.assert_not_called()
+        queue.assert_called_once_with(post.image.name)
+        self.assertContains(response, post.image.url)
+
+    def test_feed_page_looks_thumbnails_up_in_bulk(self):
+        with mock.patch.object(
+            thumbnails.transaction, "on_commit", lambda func: func()
+        ):
+            posts = [self.create_post(f"bulk-{index}.gif")
+                     for index in range(3)]
+        # Такие же байты дали бы тот же файл с готовыми миниатюрами.
+        self.create_post("missing.gif", OTHER_GIF)
+        cache.clear()
+        with mock.patch.object(thumbnails, "lookup") as lookup, \
+                mock.patch.object(thumbnails, "queue") as queue, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("posts:index"))
+        lookup.assert_not_called()
+        queue.assert_called_once()
+        kvstore_queries = [query for query in queries
+                           if "thumbnail_kvstore" in query["sql"]]
+        self.assertEqual(len(kvstore_queries), 1)
+        for post in posts:
+            geometry, options = thumbnails.GEOMETRIES["card"]
+            self.assertContains(
+                response,
+                thumbnails.thumbnail_file(post.image, geometry, options).url,
+            )
+
+    def test_background_generation_refreshes_cached_pages(self):
+        post = self.create_post("refresh.gif", OTHER_GIF)
+        scope = caching.post_scope(post.pk)
+        version = caching.get_versions(scope)
+        with mock.patch.object(thumbnails.connections, "close_all"):
+            thumbnails._run(post.image.name)
+        self.assertNotEqual(caching.get_versions(scope), version)
+
+    def test_missing_source_is_not_retried_on_every_page(self):
+        post = Post.objects.create(
+            text="text", author=self.author, image="posts/gone.gif"
+        )
+        cache.clear()
+        scopes = (caching.post_scope(post.pk), caching.posts_scope())
+        versions = caching.get_versions(*scopes)
+        with mock.patch.object(
+            thumbnails.transaction, "on_commit", lambda func: func()
+        ), mock.patch.object(
+            thumbnails, "generate", wraps=thumbnails.generate
+        ) as generate:
+            for _ in range(2):
+                self.assertIsNone(thumbnails.lookup(post.image, "card"))
+        generate.assert_called_once_with(post.image.name)
+        self.assertEqual(caching.get_versions(*scopes), versions)
@@ -8,9 +8,13 @@ from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post, Follow
-from ..views import POSTS_PER_PAGE
+from ..counters import stats_for
+from ..models import AuthorStats, Comment, Group, Post, Follow
+from ..paginators import CountingPaginator, CursorPaginator
+from ..views import COMMENTS_PER_PAGE, POSTS_PER_PAGE
 
 TEMP_NUMB_FIRST_PAGE: int = 13
 TEMP_NUMB_SECOND_PAGE: int = 3
@@ -55,6 +59,7 @@ class PostPagesTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         # Создаем авторизованный клиент
         self.user = User.objects.create_user(username="TestUser")
         self.authorized_client = Client()
@@ -207,20 +212,61 @@ class PostPagesTests(TestCase):
         )
 
     def test_cache_index(self):
-        """Проверка хранения и очищения кэша для index."""
+        """Лента index хранится в кэше и сбрасывается новым постом."""
         response = self.authorized_client.get(reverse("posts:index"))
         posts = response.content
+        Post.objects.filter(pk=self.post.pk).update(text="changed_quietly")
+        response_old = self.authorized_client.get(reverse("posts:index"))
+        old_posts = response_old.content
+        self.assertEqual(old_posts, posts)
         Post.objects.create(
             text="test_new_post",
             author=self.author,
         )
-        response_old = self.authorized_client.get(reverse("posts:index"))
-        old_posts = response_old.content
-        self.assertEqual(old_posts, posts)
-        cache.clear()
         response_new = self.authorized_client.get(reverse("posts:index"))
         new_posts = response_new.content
         self.assertNotEqual(old_posts, new_posts)
+        self.assertIn("test_new_post", new_posts.decode())
+
+    def test_cache_is_kept_per_page(self):
+        """Каждая страница ленты кэшируется под своим ключом."""
+        Post.objects.bulk_create([
+            Post(text=f"page_post_{index}", author=self.author)
+            for index in range(POSTS_PER_PAGE + 1)
+        ])
+        first = self.client.get(reverse("posts:index"))
+        second = self.client.get(
+            reverse("posts:index"),
+            {"cursor": first.context["page_obj"].next_cursor},
+        )
+        self.assertNotEqual(first.content, second.content)
+
+    def test_cache_of_group_and_profile_is_invalidated(self):
+        """Изменение поста сбрасывает кэш лент его группы и автора."""
+        addresses = [
+            reverse("posts:group_list", args=[self.group.slug]),
+            reverse("posts:profile", args=[self.author.username]),
+        ]
+        for address in addresses:
+            self.client.get(address)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = "edited_text"
+        post.save()
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertIn("edited_text", response.content.decode())
+
+    def test_cache_of_old_group_is_invalidated_on_move(self):
+        address = reverse("posts:group_list", args=[self.group.slug])
+        response = self.client.get(address)
+        self.assertIn(self.post.text, response.content.decode())
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = self.second_group
+        post.save()
+        self.assertNotIn(
+            self.post.text, self.client.get(address).content.decode()
+        )
 
 
 class PaginatorViewsTest(TestCase):
@@ -273,6 +319,482 @@ class PaginatorViewsTest(TestCase):
                 )
 
 
+class ElidedPageRangeTests(TestCase):
+    """Ссылок на страницы всегда немного, сколько бы страниц ни было."""
+
+    MAX_LINKS = 2 * (
+        CountingPaginator.on_each_side + CountingPaginator.on_ends
+    ) + 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        Post.objects.create(text="text", author=cls.author)
+        stats_for(cls.author.pk)
+
+    def page_range(self, number, pages):
+        paginator = CountingPaginator(
+            Post.objects.all(), POSTS_PER_PAGE, pages * POSTS_PER_PAGE
+        )
+        return paginator.page(number).elided_page_range
+
+    def test_short_range_is_not_elided(self):
+        self.assertEqual(self.page_range(1, 5), [1, 2, 3, 4, 5])
+
+    def test_large_range_is_windowed(self):
+        pages = 100_000
+        cases = {
+            1: [1, 2, 3, 4, "…", 99_999, 100_000],
+            50_000: [1, 2, "…", 49_997, 49_998, 49_999, 50_000, 50_001,
+                     50_002, 50_003, "…", 99_999, 100_000],
+            pages: [1, 2, "…", 99_997, 99_998, 99_999, 100_000],
+        }
+        for number, expected in cases.items():
+            with self.subTest(number=number):
+                self.assertEqual(self.page_range(number, pages), expected)
+        for number in (6, 7, 99_994, 99_995):
+            with self.subTest(number=number):
+                page_range = self.page_range(number, pages)
+                self.assertLessEqual(len(page_range), self.MAX_LINKS)
+                self.assertIn(number, page_range)
+
+    def test_template_renders_constant_number_of_links(self):
+        AuthorStats.objects.filter(user=self.author).update(
+            posts_count=10 ** 6 * POSTS_PER_PAGE
+        )
+        address = reverse("posts:profile", args=[self.author.username])
+        response = self.client.get(address + "?page=500000")
+        content = response.content.decode()
+        self.assertEqual(content.count("page-link"), self.MAX_LINKS + 4)
+        self.assertIn("?page=1000000", content)
+        self.assertIn('<span class="page-link">500000</span>', content)
+
+
+class CommentsPaginationTests(TestCase):
+    """Комментарии выводятся порциями по курсору ``(created, id)``."""
+
+    COMMENTS = COMMENTS_PER_PAGE * 2 + 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.post = Post.objects.create(text="text", author=cls.author)
+        User.objects.bulk_create(
+            User(username=f"reader-{index}") for index in range(5)
+        )
+        readers = list(User.objects.filter(username__startswith="reader"))
+        # Одинаковое время у всех комментариев: порядок задаёт id.
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=readers[index % 5],
+                    text=f"comment {index}")
+            for index in range(cls.COMMENTS)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_comments_are_loaded_in_batches(self):
+        response = self.client.get(
+            reverse("posts:post_detail", args=[self.post.pk])
+        )
+        comments = response.context["comments"]
+        texts = [comment.text for comment in comments]
+        self.assertEqual(len(texts), COMMENTS_PER_PAGE)
+        self.assertContains(response, "data-load-more")
+        fragment = reverse("posts:post_comments", args=[self.post.pk])
+        while comments.next_cursor:
+            # ETag, пост и порция комментариев вместе с авторами.
+            with self.assertNumQueries(3):
+                response = self.client.get(
+                    fragment, {"cursor": comments.next_cursor}
+                )
+            self.assertNotContains(response, "<html")
+            comments = response.context["comments"]
+            texts += [comment.text for comment in comments]
+        self.assertEqual(
+            texts, [f"comment {index}" for index in range(self.COMMENTS)]
+        )
+        self.assertNotContains(response, "data-load-more")
+
+    def test_cursor_on_post_page_shows_next_batch(self):
+        address = reverse("posts:post_detail", args=[self.post.pk])
+        cursor = self.client.get(address).context["comments"].next_cursor
+        response = self.client.get(address, {"cursor": cursor})
+        self.assertEqual(
+            response.context["comments"][0].text,
+            f"comment {COMMENTS_PER_PAGE}",
+        )
+
+    def test_new_comment_changes_fragment_etag(self):
+        fragment = reverse("posts:post_comments", args=[self.post.pk])
+        etag = self.client.get(fragment)["ETag"]
+        Comment.objects.create(post=self.post, author=self.author, text="c")
+        response = self.client.get(fragment, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_post_fragment_is_404(self):
+        response = self.client.get(reverse("posts:post_comments", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="CursorAuthor")
+        cls.group = Group.objects.create(
+            title="test_title",
+            description="test_description",
+            slug="test-slug",
+        )
+        Post.objects.bulk_create([
+            Post(text=f"text{post_temp}", author=cls.author, group=cls.group)
+            for post_temp in range(TEMP_NUMB_FIRST_PAGE)
+        ])
+        cls.pages_address = [
+            reverse("posts:index"),
+            reverse("posts:group_list", kwargs={"slug": cls.group.slug}),
+            reverse("posts:profile", kwargs={"username": cls.author}),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_next_cursor_leads_to_second_page(self):
+        """Курсор следующей страницы отдаёт оставшиеся посты."""
+        for address in self.pages_address:
+            with self.subTest(address=address):
+                first = self.client.get(address).context["page_obj"]
+                self.assertIsNone(first.previous_cursor)
+                self.assertIsNotNone(first.next_cursor)
+                second = self.client.get(
+                    address, {"cursor": first.next_cursor}
+                ).context["page_obj"]
+                self.assertEqual(len(second), TEMP_NUMB_SECOND_PAGE)
+                self.assertIsNone(second.next_cursor)
+                ids = [post.pk for post in first] + [
+                    post.pk for post in second
+                ]
+                self.assertEqual(len(set(ids)), TEMP_NUMB_FIRST_PAGE)
+
+    def test_cursor_page_is_stable_when_new_post_added(self):
+        """Новый пост не сдвигает содержимое страницы по курсору."""
+        address = reverse("posts:index")
+        first = self.client.get(address).context["page_obj"]
+        Post.objects.create(text="new", author=self.author)
+        cache.clear()
+        second = self.client.get(
+            address, {"cursor": first.next_cursor}
+        ).context["page_obj"]
+        self.assertNotIn(first[-1], list(second))
+        self.assertEqual(len(second), TEMP_NUMB_SECOND_PAGE)
+
+    def test_previous_cursor_returns_to_first_page(self):
+        address = reverse("posts:index")
+        first = self.client.get(address).context["page_obj"]
+        second = self.client.get(
+            address, {"cursor": first.next_cursor}
+        ).context["page_obj"]
+        cache.clear()
+        back = self.client.get(
+            address, {"cursor": second.previous_cursor}
+        ).context["page_obj"]
+        self.assertEqual(list(back), list(first))
+        self.assertIsNotNone(back.next_cursor)
+
+    def test_broken_cursor_returns_first_page(self):
+        address = reverse("posts:index")
+        response = self.client.get(address, {"cursor": "not-a-cursor"})
+        self.assertEqual(
+            len(response.context["page_obj"]), POSTS_PER_PAGE
+        )
+
+    def test_cursor_page_does_not_count_rows(self):
+        """Страница по курсору не выполняет COUNT(*)."""
+        paginator = CursorPaginator(Post.objects.all(), POSTS_PER_PAGE)
+        with self.assertNumQueries(1):
+            page = paginator.get_page(None)
+            self.assertEqual(len(page), POSTS_PER_PAGE)
+
+
+class QueryCountTests(TestCase):
+    """Число запросов страницы не зависит от числа постов на ней."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(
+            title="test_title",
+            description="test_description",
+            slug="test-slug",
+        )
+        cls.author = User.objects.create_user(username="author-0")
+        cls.post = Post.objects.create(
+            text="text", author=cls.author, group=cls.group
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        # Первое чтение счётчиков автора создаёт их строку.
+        stats_for(cls.author.pk)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.addresses = [
+            reverse("posts:index"),
+            reverse("posts:group_list", args=[self.group.slug]),
+            reverse("posts:profile", args=[self.author.username]),
+            reverse("posts:follow_index"),
+            reverse("posts:post_detail", args=[self.post.pk]),
+        ]
+
+    def count_queries(self):
+        counts = {}
+        for address in self.addresses:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.reader_client.get(address)
+            counts[address] = len(queries)
+        return counts
+
+    def test_feeds_run_fixed_number_of_queries(self):
+        before = self.count_queries()
+        for index in range(1, POSTS_PER_PAGE):
+            author = User.objects.create_user(
+                username=f"author-{index}", first_name=f"Имя {index}"
+            )
+            group = Group.objects.create(
+                title=f"group {index}", slug=f"group-{index}",
+                description="",
+            )
+            Follow.objects.create(user=self.reader, author=author)
+            Post.objects.create(text="text", author=author, group=group)
+            Post.objects.create(text="text", author=self.author, group=group)
+            Comment.objects.create(post=self.post, author=author, text="c")
+        self.assertEqual(self.count_queries(), before)
+
+
+class CachedCountTests(TestCase):
+    """Число постов для ``?page=N`` и профиля берётся из кэша."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        Post.objects.bulk_create(
+            Post(text=f"text {index}", author=cls.author)
+            for index in range(POSTS_PER_PAGE + 3)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, address):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(address)
+        counts = [query for query in queries
+                  if query["sql"].startswith("SELECT COUNT(*)")]
+        return response, len(counts)
+
+    def test_page_count_is_cached_until_posts_change(self):
+        address = reverse("posts:index") + "?page=2"
+        response, counts = self.count_queries(address)
+        self.assertEqual(counts, 1)
+        self.assertEqual(response.context["page_obj"].paginator.count, 13)
+        _, counts = self.count_queries(address)
+        self.assertEqual(counts, 0)
+        Post.objects.create(text="new", author=self.author)
+        response, counts = self.count_queries(address)
+        self.assertEqual(counts, 1)
+        self.assertEqual(response.context["page_obj"].paginator.count, 14)
+
+    def test_profile_reads_author_counters(self):
+        address = reverse("posts:profile", args=[self.author.username])
+        self.client.get(address)
+        response, counts = self.count_queries(address + "?page=2")
+        self.assertEqual(counts, 0)
+        self.assertEqual(response.context["page_obj"].paginator.count, 13)
+        self.assertContains(response, "Всего постов: 13")
+
+    @override_settings(FEED_COUNT_ESTIMATE_THRESHOLD=5)
+    def test_large_count_is_estimated_after_changes(self):
+        address = reverse("posts:index") + "?page=2"
+        self.count_queries(address)
+        Post.objects.create(text="new", author=self.author)
+        response, counts = self.count_queries(address)
+        self.assertEqual(counts, 0)
+        paginator = response.context["page_obj"].paginator
+        self.assertEqual(paginator.count, 13)
+        self.assertTrue(paginator.count_is_estimate)
+
+
+class ConditionalGetTests(TestCase):
+    """Повторный запрос с ``If-None-Match`` получает 304 без рендеринга."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(title="Группа", slug="group")
+        cls.post = Post.objects.create(
+            text="text", author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addresses = [
+            reverse("posts:index"),
+            reverse("posts:group_list", args=[self.group.slug]),
+            reverse("posts:profile", args=[self.author.username]),
+            reverse("posts:post_detail", args=[self.post.pk]),
+        ]
+
+    def revalidate(self, address, client=None):
+        client = client or self.client
+        etag = client.get(address)["ETag"]
+        return etag, client.get(address, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_are_not_modified(self):
+        for address in self.addresses:
+            with self.subTest(address=address):
+                _, response = self.revalidate(address)
+                self.assertEqual(response.status_code, 304)
+                self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_not_modified_costs_one_query(self):
+        for address, queries in zip(self.addresses, (0, 1, 1, 1)):
+            with self.subTest(address=address):
+                etag = self.client.get(address)["ETag"]
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        address, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+
+    def test_changes_produce_new_etag(self):
+        changes = [
+            lambda: Post.objects.create(
+                text="new", author=self.author, group=self.group
+            ),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text="comment"
+            ),
+            lambda: Follow.objects.create(
+                user=self.reader, author=self.author
+            ),
+        ]
+        changed = {
+            0: self.addresses,
+            1: self.addresses[3:],
+            2: self.addresses[2:3],
+        }
+        for index, change in enumerate(changes):
+            etags = [self.client.get(address)["ETag"]
+                     for address in changed[index]]
+            change()
+            for address, etag in zip(changed[index], etags):
+                with self.subTest(change=index, address=address):
+                    response = self.client.get(
+                        address, HTTP_IF_NONE_MATCH=etag
+                    )
+                    self.assertEqual(response.status_code, 200)
+
+    def test_authorized_pages_are_private(self):
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        address = self.addresses[0]
+        anonymous_etag = self.client.get(address)["ETag"]
+        response = reader_client.get(address)
+        self.assertNotEqual(response["ETag"], anonymous_etag)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+        response = reader_client.get(
+            address, HTTP_IF_NONE_MATCH=anonymous_etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_login_or_csrf_token_changes_etag(self):
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        address = self.addresses[3]
+        etag = reader_client.get(address)["ETag"]
+        reader_client.logout()
+        reader_client.force_login(self.reader)
+        response = reader_client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        reader_client.cookies[settings.CSRF_COOKIE_NAME] = "rotated"
+        response = reader_client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_objects_are_still_404(self):
+        response = self.client.get(
+            reverse("posts:group_list", args=["missing"]),
+            HTTP_IF_NONE_MATCH="*",
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class PageCacheTests(TestCase):
+    """Анонимные страницы целиком берутся из кэша до изменения постов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.group = Group.objects.create(title="Группа", slug="group")
+        cls.other_group = Group.objects.create(title="Другая", slug="other")
+        cls.post = Post.objects.create(
+            text="text", author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_page_is_served_from_cache(self):
+        address = reverse("posts:post_detail", args=[self.post.pk])
+        self.client.get(address)
+        with self.assertNumQueries(1):
+            response = self.client.get(address)
+        self.assertIsNone(response.context)
+        self.assertContains(response, "text")
+
+    def test_writes_purge_only_affected_pages(self):
+        group_address = reverse("posts:group_list", args=[self.group.slug])
+        other_address = reverse(
+            "posts:group_list", args=[self.other_group.slug]
+        )
+        self.client.get(group_address)
+        self.client.get(other_address)
+        Post.objects.create(
+            text="новый пост", author=self.author, group=self.group
+        )
+        response = self.client.get(group_address)
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, "новый пост")
+        response = self.client.get(other_address)
+        self.assertIsNone(response.context)
+
+    def test_query_string_is_part_of_key(self):
+        address = reverse("posts:index")
+        self.client.get(address)
+        response = self.client.get(address + "?page=1")
+        self.assertIsNotNone(response.context)
+
+    def test_logged_in_users_bypass_cache(self):
+        author_client = Client()
+        author_client.force_login(self.author)
+        address = reverse("posts:post_detail", args=[self.post.pk])
+        self.client.get(address)
+        for _ in range(2):
+            response = author_client.get(address)
+            self.assertIsNotNone(response.context)
+            self.assertContains(response, "csrfmiddlewaretoken")
+
+
 class Test404Page(TestCase):
     def test_404page_use_correct_template(self):
         url_page = "/unexisting-page/"
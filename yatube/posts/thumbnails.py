@@ -0,0 +1,323 @@
+"""Миниатюры картинок постов.
+
+Все размеры, которые выводят шаблоны, описаны в ``GEOMETRIES``. Каждый
+размер нарезается в нескольких ширинах (``SCALES``) и форматах: JPEG
+для всех браузеров и WebP/AVIF, если их умеет сохранять Pillow. Шаблоны
+выводят их через ``<picture>`` и ``srcset``.
+
+Как только у поста сохраняется новая картинка, генерация её миниатюр
+ставится в очередь фоновых потоков: запрос загрузки не ждёт, пока Pillow
+нарежет все размеры, ширины и форматы. Шаблоны берут миниатюры только из
+хранилища ключей sorl; если их ещё нет (или картинку положили в базу в
+обход загрузки), страница показывает исходную картинку и тоже ставит
+генерацию в очередь. Когда миниатюры готовы, карточки и страницы с
+картинкой сбрасываются.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import caching, sharding
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+GEOMETRIES = {
+    "card": ("900x450", {"padding": True, "upscale": True}),
+    "detail": ("960x339", {"crop": "center", "upscale": True}),
+}
+# Ширины вариантов относительно основной: для узких экранов и для
+# экранов с высокой плотностью пикселей.
+SCALES = (0.5, 1, 1.5)
+FALLBACK_FORMAT = "JPEG"
+MODERN_FORMATS = ("AVIF", "WEBP")
+MIME_TYPES = {"AVIF": "image/avif", "WEBP": "image/webp"}
+PENDING_KEY = "thumbnail:pending:{}"
+PENDING_TIMEOUT = 60 * 5
+# Картинки, миниатюры которых не получились (файла нет или он битый),
+# не ставятся в очередь снова, пока не истечёт этот срок.
+FAILED_KEY = "thumbnail:failed:{}"
+FAILED_TIMEOUT = 60 * 60
+
+_executor = None
+
+
+class Backend(ThumbnailBackend):
+    """Бэкенд sorl, который знает расширение AVIF."""
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        if options["format"] in EXTENSIONS:
+            return super()._get_thumbnail_filename(
+                source, geometry_string, options
+            )
+        name = super()._get_thumbnail_filename(
+            source, geometry_string, {**options, "format": FALLBACK_FORMAT}
+        )
+        return f"{name.rsplit('.', 1)[0]}.{options['format'].lower()}"
+
+
+def formats():
+    """Форматы вариантов: современные, которые умеет Pillow, и JPEG."""
+    Image.init()
+    return [fmt for fmt in MODERN_FORMATS if fmt in Image.SAVE] + [
+        FALLBACK_FORMAT
+    ]
+
+
+def dimensions(size):
+    geometry, _ = GEOMETRIES[size]
+    width, height = geometry.split("x")
+    return int(width), int(height)
+
+
+def variants(size):
+    """Варианты размера ``size``: ``(формат, ширина, геометрия, опции)``."""
+    _, options = GEOMETRIES[size]
+    width, height = dimensions(size)
+    return [
+        (
+            fmt,
+            round(width * scale),
+            f"{round(width * scale)}x{round(height * scale)}",
+            {**options, "format": fmt},
+        )
+        for fmt in formats()
+        for scale in SCALES
+    ]
+
+
+class ResponsiveImage:
+    """Готовые варианты миниатюры для ``<picture>``.
+
+    ``url`` — JPEG основной ширины, ``srcset`` — все ширины JPEG,
+    ``sources`` — ``srcset`` современных форматов.
+    """
+
+    def __init__(self, size, files):
+        self.width, self.height = dimensions(size)
+        self.sizes = f"(max-width: {self.width}px) 100vw, {self.width}px"
+        by_format = {}
+        for (fmt, width), file in files.items():
+            by_format.setdefault(fmt, []).append((width, file))
+        fallback = by_format.pop(FALLBACK_FORMAT)
+        self.url = dict(fallback)[self.width].url
+        self.srcset = self._srcset(fallback)
+        self.sources = [
+            {"type": MIME_TYPES[fmt], "srcset": self._srcset(widths)}
+            for fmt, widths in by_format.items()
+        ]
+
+    @staticmethod
+    def _srcset(widths):
+        return ", ".join(
+            f"{file.url} {width}w" for width, file in sorted(widths)
+        )
+
+
+def source(image):
+    """Исходная картинка для sorl в хранилище поля ``Post.image``.
+
+    От хранилища зависит ключ картинки в sorl, поэтому и имена миниатюр:
+    при поиске и при генерации он должен быть одинаковым.
+    """
+    name = getattr(image, "name", image)
+    return ImageFile(name, Post._meta.get_field("image").storage)
+
+
+def thumbnail_file(image, geometry, options):
+    """Файл миниатюры ``image``, без обращения к хранилищу.
+
+    Имя считается так же, как в ``ThumbnailBackend.get_thumbnail``,
+    поэтому совпадает с именем, под которым sorl сохранит миниатюру.
+    """
+    backend = default.backend
+    image = source(image)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault("format", backend._get_format(image))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(image, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def lookup(image, size):
+    """Готовые варианты миниатюры или ``None``.
+
+    Недостающие варианты ставятся в очередь на генерацию.
+    """
+    if not image:
+        return None
+    files = {
+        (fmt, width): default.kvstore.get(
+            thumbnail_file(image, geometry, options)
+        )
+        for fmt, width, geometry, options in variants(size)
+    }
+    return _responsive(image, size, files)
+
+
+def prefetch(posts, size):
+    """Находит миниатюры ``size`` для всех ``posts`` разом.
+
+    Вместо запроса к хранилищу sorl на каждый вариант ключи читаются
+    одним ``get_many`` из кэша, а недостающие — одним запросом к таблице
+    ``thumbnail_kvstore``. Результат кладётся в ``post.thumbnails``, его
+    читает тег ``post_thumbnail``.
+    """
+    posts = [post for post in posts if post.image]
+    if not posts:
+        return
+    kvstore = default.kvstore
+    if not isinstance(kvstore, KVStore):
+        for post in posts:
+            _attach(post, size, lookup(post.image, size))
+        return
+    size_variants = variants(size)
+    keys = {
+        (post.pk, fmt, width): add_prefix(
+            thumbnail_file(post.image, geometry, options).key
+        )
+        for post in posts
+        for fmt, width, geometry, options in size_variants
+    }
+    values = kvstore.cache.get_many(list(keys.values()))
+    missing = [key for key in keys.values() if key not in values]
+    if missing:
+        loaded = dict(
+            KVStoreModel.objects.filter(key__in=missing)
+            .values_list("key", "value")
+        )
+        # Как и sorl, запоминаем в кэше и отсутствие миниатюры.
+        loaded = {key: loaded.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            loaded, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(loaded)
+    for post in posts:
+        files = {}
+        for fmt, width, _, _ in size_variants:
+            value = values[keys[post.pk, fmt, width]]
+            files[fmt, width] = (
+                None if value == EMPTY_VALUE or not value
+                else deserialize_image_file(value)
+            )
+        _attach(post, size, _responsive(post.image, size, files))
+
+
+def _responsive(image, size, files):
+    if not all(files.values()):
+        queue(image.name)
+    files = {variant: file for variant, file in files.items() if file}
+    width, _ = dimensions(size)
+    if (FALLBACK_FORMAT, width) not in files:
+        return None
+    return ResponsiveImage(size, files)
+
+
+def _attach(post, size, thumbnail):
+    if not hasattr(post, "thumbnails"):
+        post.thumbnails = {}
+    post.thumbnails[size] = thumbnail
+
+
+def queue(name):
+    """Ставит генерацию всех миниатюр картинки ``name`` в очередь.
+
+    Ключ в кэше не даёт нескольким запросам (и процессам, если кэш
+    общий) генерировать одну картинку одновременно, а картинки, для
+    которых генерация недавно не удалась, в очередь не попадают.
+    """
+    if cache.get(FAILED_KEY.format(name)):
+        return
+    if cache.add(PENDING_KEY.format(name), True, PENDING_TIMEOUT):
+        transaction.on_commit(lambda: _submit(name))
+
+
+def _submit(name):
+    if settings.THUMBNAIL_WORKERS:
+        _get_executor().submit(_run_in_background, name)
+    else:
+        _run(name)
+
+
+def generate(name):
+    """Генерирует все варианты всех миниатюр картинки ``name``.
+
+    Возвращает, сохранился ли JPEG основной ширины каждого размера.
+    Если нет, картинка запоминается как неудачная на ``FAILED_TIMEOUT``.
+    """
+    stored = False
+    try:
+        image = source(name)
+        for size in GEOMETRIES:
+            for _, _, geometry, options in variants(size):
+                get_thumbnail(image, geometry, **options)
+        stored = all(_fallback_stored(image, size) for size in GEOMETRIES)
+    except Exception:
+        logger.exception("Не удалось сделать миниатюры для %s", name)
+    finally:
+        cache.delete(PENDING_KEY.format(name))
+    if not stored:
+        logger.warning("Нет миниатюр для %s", name)
+        cache.set(FAILED_KEY.format(name), True, FAILED_TIMEOUT)
+    return stored
+
+
+def _fallback_stored(image, size):
+    # Для пустого или битого исходника sorl не бросает исключение,
+    # а просто не сохраняет миниатюру.
+    width, _ = dimensions(size)
+    return any(
+        default.kvstore.get(thumbnail_file(image, geometry, options))
+        for fmt, variant_width, geometry, options in variants(size)
+        if fmt == FALLBACK_FORMAT and variant_width == width
+    )
+
+
+def _run(name):
+    if not generate(name):
+        return
+    # Страницы и карточки с исходной картинкой вместо миниатюры
+    # больше не нужны.
+    for posts in sharding.each_shard(Post.objects.filter(image=name)):
+        posts.update(updated=timezone.now())
+        for post_id, author_id, group_id in posts.values_list(
+            "pk", "author_id", "group_id"
+        ):
+            caching.bump_post(post_id, author_id, group_id)
+
+
+def _run_in_background(name):
+    try:
+        _run(name)
+    finally:
+        # У фонового потока свои соединения с базой, их нужно закрыть.
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix="thumbnails",
+        )
+    return _executor
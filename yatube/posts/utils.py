@@ -0,0 +1,32 @@
+from functools import partial
+
+from .caching import cached_count
+from .paginators import CountingPaginator, CursorPaginator
+from .sharding import MergedQuerySet
+
+
+def paginate(request, queryset, per_page, scopes, paginator=None,
+             count=None):
+    """Возвращает страницу ленты для запроса.
+
+    Новые ссылки ведут по курсору (``?cursor=``) через ``paginator``,
+    по умолчанию ``CursorPaginator`` над ``queryset``; старые ссылки вида
+    ``?page=N`` продолжают работать по номеру страницы, а число постов
+    берётся из ``count`` или из кэша областей ``scopes``.
+
+    Выборку, слитую из нескольких баз (шардов), по номеру не листают:
+    смещение пришлось бы считать, загружая все предыдущие страницы с
+    каждого шарда. Такие ссылки открывают первую страницу по курсору.
+    """
+    page_number = request.GET.get("page")
+    if isinstance(queryset, MergedQuerySet) and not queryset.same_database:
+        page_number = None
+    if page_number is not None:
+        if count is None:
+            count = partial(cached_count, queryset, *scopes)
+        return CountingPaginator(
+            queryset, per_page, count
+        ).get_page(page_number)
+    if paginator is None:
+        paginator = CursorPaginator(queryset, per_page)
+    return paginator.get_page(request.GET.get("cursor"))
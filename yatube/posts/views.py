@@ -1,56 +1,103 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth import get_user_model
-from django.core.paginator import Paginator
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 
+from core.replicas import replica_reads
 from posts.models import Group, Post, Follow
+from . import archive, caching, counters, sharding
+from .conditional import (
+    conditional, group_etag, index_etag, post_etag, profile_etag
+)
+from .feeds import follow_paginator, followed_posts
 from .forms import PostForm, CommentForm
+from .paginators import CursorPaginator
+from .search import search_paginator
+from .sharding import across_shards, get_post_or_404
+from .utils import paginate
 
 User = get_user_model()
 
 POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
 CHARACTERS_FOR_POST = 30
 
 
+@replica_reads
+@conditional(index_etag)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    post_list = across_shards(Post.objects.for_feed())
+    scopes = (caching.posts_scope(),)
+    page_obj = paginate(request, post_list, POSTS_PER_PAGE, scopes)
     context = {
         "page_obj": page_obj,
+        "feed_cache": caching.feed_cache(request, *scopes),
     }
     return render(request, "posts/index.html", context)
 
 
+@replica_reads
+@conditional(group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, POSTS_PER_PAGE)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    posts = across_shards(group.posts.for_feed())
+    scopes = (caching.group_scope(group.pk),)
+    page_obj = paginate(request, posts, POSTS_PER_PAGE, scopes)
     context = {
         "group": group,
         "page_obj": page_obj,
+        "feed_cache": caching.feed_cache(request, *scopes),
     }
     return render(request, "posts/group_list.html", context)
 
 
+@replica_reads
+@conditional(post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = archive.get_post_or_404(post_id)
     context = {
         "post": post,
-        "comments": comments,
+        "author_stats": counters.stats_for(post.author_id),
+        "comments": comments_page(request, post),
         "form": CommentForm()
     }
     template = "posts/post_detail.html"
     return render(request, template, context)
 
 
+@replica_reads
+@conditional(post_etag)
+def post_comments(request, post_id):
+    """Следующая порция комментариев для кнопки «Показать ещё»."""
+    post = archive.get_post_or_404(post_id, "pk")
+    context = {
+        "post": post,
+        "comments": comments_page(request, post),
+    }
+    return render(request, "includes/comments.html", context)
+
+
+def comments_page(request, post):
+    """Комментарии по курсору ``(created, id)`` вместе с авторами.
+
+    Авторы берутся одним JOIN, а на шардах, где пользователей нет, —
+    вторым запросом в основную базу.
+    """
+    comments = post.comments.order_by("created", "pk")
+    if sharding.enabled():
+        comments = comments.prefetch_related("author")
+    else:
+        comments = comments.select_related("author")
+    paginator = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, keys=("created", "pk")
+    )
+    return paginator.get_page(request.GET.get("cursor"))
+
+
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_post_or_404(Post.objects.all(), post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -60,19 +107,24 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@replica_reads
+@conditional(profile_etag)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
     template = "posts/profile.html"
-    posts = author.posts.all()
+    posts = archive.author_posts(author.pk)
     user = request.user
-    post_count = posts.count()
-    paginator = Paginator(posts, POSTS_PER_PAGE)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    scopes = (caching.author_scope(author.pk),)
+    stats = counters.stats_for(author.pk)
+    page_obj = paginate(
+        request, posts, POSTS_PER_PAGE, scopes, count=stats.posts_count
+    )
     context = {
         "page_obj": page_obj,
         "author": author,
-        "posts_count": post_count,
+        "author_stats": stats,
+        "posts_count": stats.posts_count,
+        "feed_cache": caching.feed_cache(request, *scopes),
     }
     if user.is_authenticated:
         context['following'] = user.follower.filter(author=author).exists()
@@ -97,7 +149,7 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_post_or_404(Post.objects.all(), post_id)
     if post.author != request.user:
         return redirect("posts:post_detail", post_id)
     form = PostForm(request.POST or None,
@@ -115,14 +167,31 @@ def post_edit(request, post_id):
     return render(request, template, context)
 
 
+def search(request):
+    query = request.GET.get("q", "").strip()
+    paginator = search_paginator(query, POSTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get("cursor"))
+    context = {
+        "query": query,
+        "page_obj": page_obj,
+        # Ссылки пагинатора сохраняют строку поиска.
+        "page_query": urlencode({"q": query}) + "&",
+    }
+    return render(request, "posts/search.html", context)
+
+
 @login_required
+@replica_reads
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    post_list = followed_posts(request.user)
+    scopes = (caching.posts_scope(), caching.follow_scope(request.user.pk))
+    page_obj = paginate(
+        request, post_list, POSTS_PER_PAGE, scopes,
+        follow_paginator(request.user, POSTS_PER_PAGE),
+    )
     context = {
         'page_obj': page_obj,
+        'feed_cache': caching.feed_cache(request, *scopes),
     }
     return render(request, 'posts/follow.html', context)
 
@@ -132,12 +201,9 @@ def profile_follow(request, username):
     if request.user.username == username:
         return redirect("posts:profile", username=username)
     following = get_object_or_404(User, username=username)
-    already_follows = Follow.objects.filter(
-        user=request.user,
-        author=following
-    ).exists()
-    if not already_follows:
-        Follow.objects.create(user=request.user, author=following)
+    # Повторная подписка при гонке упирается в unique_follow, и
+    # get_or_create возвращает уже созданную строку.
+    Follow.objects.get_or_create(user=request.user, author=following)
     return redirect("posts:profile", username=username)
 
 
@@ -23,7 +23,9 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = "zfe2jp)af0_ltmv8ec6j15sbj__ww-t)kd0^%uj)2$!lgsi_rk"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# В продакшене запускайте с DJANGO_DEBUG=0: тогда включается и
+# кэширующий загрузчик шаблонов.
+DEBUG = os.environ.get("DJANGO_DEBUG", "1") == "1"
 
 ALLOWED_HOSTS = [
     "localhost",
@@ -36,7 +38,7 @@ ALLOWED_HOSTS = [
 # Application definition
 
 INSTALLED_APPS = [
-    "posts",
+    "posts.apps.PostsConfig",
     "users.apps.UsersConfig",
     "core",
     "about",
@@ -60,6 +62,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.replicas.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -72,6 +75,8 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [TEMPLATES_DIR],
+        # Без DEBUG Django сам оборачивает загрузчики в cached.Loader, и
+        # скомпилированные шаблоны хранятся в памяти процесса.
         "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
@@ -93,11 +98,53 @@ WSGI_APPLICATION = "yatube.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        # SQLite с WAL и прагмами для одновременных чтений и записей,
+        # см. core/backends/sqlite3/base.py.
+        "ENGINE": "core.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        # Соединение не открывается заново на каждый запрос.
+        "CONN_MAX_AGE": 600,
     }
 }
 
+# Реплики только для чтения: DJANGO_DB_REPLICAS=replica1,replica2 —
+# файлы db-replica1.sqlite3 и т.д. Их заполняет команда replicate,
+# а читают страницы лент и постов (см. core/replicas.py). Сессия,
+# которая писала в базу, ещё REPLICA_PIN_SECONDS читает из основной.
+DATABASE_REPLICAS = [
+    alias for alias in os.environ.get("DJANGO_DB_REPLICAS", "").split(",")
+    if alias
+]
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "NAME": os.path.join(BASE_DIR, f"db-{alias}.sqlite3"),
+        "TEST": {"MIRROR": "default"},
+    }
+# Шарды постов и комментариев: DJANGO_POST_SHARDS=default,shard1 —
+# посты автора лежат на одном из них (см. posts/sharding.py). Новые шарды
+# нужно создать командой migrate --database и перенести на них посты
+# командой rebalance_shards. На шардах нет пользователей и групп, поэтому
+# внешние ключи там не проверяются.
+POST_SHARDS = [
+    alias for alias in os.environ.get("DJANGO_POST_SHARDS", "").split(",")
+    if alias
+]
+for alias in POST_SHARDS:
+    DATABASES.setdefault(alias, {
+        **DATABASES["default"],
+        "NAME": os.path.join(BASE_DIR, f"db-{alias}.sqlite3"),
+        "OPTIONS": {"pragmas": {"foreign_keys": "OFF"}},
+    })
+DATABASE_ROUTERS = [
+    "posts.sharding.ShardRouter",
+    "core.replicas.ReplicaRouter",
+]
+REPLICA_PIN_SECONDS = 10
+# Посты старше стольких дней команда archive_posts переносит из горячей
+# таблицы в архив (см. posts/archive.py).
+POST_ARCHIVE_AFTER_DAYS = 365
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -153,10 +200,58 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Версии лент, страницы и фрагменты должны быть общими для всех
+# процессов сервера, иначе запись в одном процессе не сбросит кэш другого
+# (см. проверку posts.E001). SQLite держит сайт на одной машине, поэтому
+# хватает файлового кэша; memcached подключается так же через CACHES.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            "DJANGO_CACHE_DIR", os.path.join(BASE_DIR, "cache")
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100_000,
+        },
     }
 }
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Лента подписок. FOLLOW_FEED_BACKEND выбирает способ сборки:
+# "inbox" — посты раскладываются по лентам подписчиков при публикации,
+# если подписчиков не больше FEED_FANOUT_LIMIT, а при подписке в ленту
+# добавляются FEED_BACKFILL_LIMIT последних постов; "pull" — лента
+# сливается из кэшированных списков FEED_RECENT_POSTS последних постов
+# каждого автора; "join" — соединение Follow и Post в базе.
+# После смены бэкенда на "inbox" нужно выполнить rebuild_feeds.
+FOLLOW_FEED_BACKEND = "inbox"
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL_LIMIT = 200
+FEED_RECENT_POSTS = 50
+
+# Фрагменты лент живут долго: их сбрасывают сигналы об изменении постов.
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# Страницы для анонимных посетителей сбрасываются версиями областей,
+# а не по времени.
+PAGE_CACHE_TIMEOUT = None
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# Число постов в лентах больше порога не пересчитывается после каждого
+# изменения, а показывается приблизительно в течение таймаута.
+FEED_COUNT_ESTIMATE_THRESHOLD = 10_000
+FEED_COUNT_ESTIMATE_TIMEOUT = 60 * 10
+
+# Загруженные картинки уменьшаются до этого размера по большей стороне
+# и пересохраняются без метаданных.
+IMAGE_MAX_SIZE = 2048
+IMAGE_JPEG_QUALITY = 85
+
+# Потоки, которые генерируют миниатюры новых картинок и догенерируют не
+# найденные при показе страницы. При 0 миниатюры делаются сразу после
+# фиксации транзакции, в потоке запроса: так работают тесты (см.
+# core.test_runner), которые удаляют временный MEDIA_ROOT сразу после
+# запроса.
+THUMBNAIL_WORKERS = int(os.environ.get("DJANGO_THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_BACKEND = "posts.thumbnails.Backend"